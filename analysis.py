@@ -0,0 +1,149 @@
+# =============================================================================
+# RESPONSE ANALYSIS
+# -----------------------------------------------------------------------------
+# This file measures the responses of many runs at once. The voltage traces
+# of a batch of runs are stacked into one (runs x samples) array on a common
+# time grid, and spike detection, spike counts in response windows,
+# first-spike latencies, peak depolarisation and IPSP amplitudes are
+# computed with whole-array numpy operations instead of a python loop over
+# runs, e.g.
+#
+#     rows = sweep.run_sweep(points, keep_traces=True)
+#     t, v = stack([row['traces'] for row in rows], 'v_rc')
+#     counts = window_counts(t, v, [(5, 15), (15, 25)])   # runs x windows
+#     latency = first_spike(t, v, after=5) - 5
+#     ipsp = ipsp_amplitude(t, v, window=(13, 25))
+#
+# A spike is an upward crossing of threshold and is timed at the first
+# sample at or above it, as in 'sweep.py'. Runs without a spike get nan
+# latencies. With interpolate=True spikes are timed where the straight line
+# between that sample and the one before crosses threshold, and peaks are
+# the top of the parabola through the highest sample and its neighbours, so
+# that they change smoothly with the parameters of a run instead of in steps
+# of dt (as 'surface.py' needs); such a peak can exceed every sample.
+# =============================================================================
+
+import numpy as np
+from neuron.units import mV
+
+
+# common time grid and (runs x samples) array of one trace of many runs
+def stack(runs, name='v_rc'):
+    t = np.asarray(runs[0]['t'])
+    for traces in runs[1:]:
+        if len(traces['t']) != len(t) or not np.array_equal(traces['t'], t):
+            raise ValueError('runs must share one time grid to be stacked')
+    return t, np.stack([np.asarray(traces[name]) for traces in runs])
+
+
+# (runs x samples) array, True at the first sample of every spike
+def spikes(v, threshold=0 * mV):
+    v = np.atleast_2d(v)
+    above = v >= threshold
+    onsets = np.zeros(v.shape, dtype=bool)
+    onsets[:, 1:] = above[:, 1:] & ~above[:, :-1]
+    return onsets
+
+
+# threshold crossing times between the samples before the given ones and
+# the given ones, interpolated linearly
+def _crossing(t, v, runs, samples, threshold):
+    v = np.atleast_2d(v)
+    before, after = v[runs, samples - 1], v[runs, samples]
+    fraction = (threshold - before) / (after - before)
+    return t[samples - 1] + fraction * (t[samples] - t[samples - 1])
+
+
+# spike times of every run, as a list of arrays
+def spike_times(t, v, threshold=0 * mV, interpolate=False):
+    found = spikes(v, threshold)
+    if not interpolate:
+        return [t[row] for row in found]
+    runs, samples = np.nonzero(found)
+    times = _crossing(t, v, runs, samples, threshold)
+    return np.split(times, np.cumsum(found.sum(axis=1))[:-1])
+
+
+# number of spikes of every run in each window [start, stop), runs x windows
+def window_counts(t, v, windows, threshold=0 * mV):
+    windows = np.asarray(windows, dtype=float).reshape(-1, 2)
+    counts = np.cumsum(spikes(v, threshold), axis=1)
+    counts = np.concatenate([np.zeros((len(counts), 1), dtype=counts.dtype), counts], axis=1)
+    start = np.searchsorted(t, windows[:, 0])
+    stop = np.searchsorted(t, windows[:, 1])
+    return counts[:, stop] - counts[:, start]
+
+
+# number of spikes of every run
+def spike_counts(t, v, threshold=0 * mV):
+    return spikes(v, threshold).sum(axis=1)
+
+
+# time of the first spike at or after 'after' in every run, nan if none (an
+# interpolated spike found at the first sample after it may cross
+# threshold before it)
+def first_spike(t, v, threshold=0 * mV, after=None, interpolate=False):
+    found = spikes(v, threshold)
+    if after is not None:
+        found &= t >= after
+    return _first(t, v, found, threshold, interpolate)
+
+
+# time of the first of the found spikes of every run, nan if none
+def _first(t, v, found, threshold, interpolate):
+    if not interpolate:
+        return np.where(found.any(axis=1), t[found.argmax(axis=1)], np.nan)
+    times = np.full(len(found), np.nan)
+    runs = np.flatnonzero(found.any(axis=1))
+    times[runs] = _crossing(t, v, runs, found[runs].argmax(axis=1), threshold)
+    return times
+
+
+# samples of every run within [start, stop) of the time grid
+def _window(t, v, window):
+    if window is None:
+        return np.atleast_2d(v)
+    start, stop = np.searchsorted(t, window)
+    if stop <= start:
+        raise ValueError('window {} holds no samples'.format(tuple(window)))
+    return np.atleast_2d(v)[:, start:stop]
+
+
+# highest voltage of every run, within a window if given
+def peak(t, v, window=None, interpolate=False):
+    v = _window(t, v, window)
+    top = v.max(axis=1)
+    if not interpolate:
+        return top
+    t = _window(t, t, window)[0]
+    i = v.argmax(axis=1)
+    inner = np.flatnonzero((i > 0) & (i < len(t) - 1))
+    i = i[inner]
+    t0, t1, t2 = t[i - 1], t[i], t[i + 1]
+    y0, y1, y2 = v[inner, i - 1], v[inner, i], v[inner, i + 1]
+    # the parabola y1 + slope (t - t1) + curve (t - t1)^2 through the three
+    slope0, slope2 = (y1 - y0) / (t1 - t0), (y2 - y1) / (t2 - t1)
+    curve = (slope2 - slope0) / (t2 - t0)
+    slope = slope0 + curve * (t1 - t0)
+    bent = curve < 0
+    top[inner[bent]] = y1[bent] - slope[bent] ** 2 / (4 * curve[bent])
+    return top
+
+
+# depth of the hyperpolarisation in a window below the voltage at its start
+# (or the mean over a baseline window), e.g. of the relay cell after the
+# triadic (triad_inh) and axosomatic (rc_inh) inhibition arrive
+def ipsp_amplitude(t, v, window, baseline=None):
+    if baseline is None:
+        base = _window(t, v, window)[:, 0]
+    else:
+        base = _window(t, v, baseline).mean(axis=1)
+    return base - _window(t, v, window).min(axis=1)
+
+
+# the relay cell measures of 'sweep.py' for every run, as arrays
+def summarise(t, v, threshold=0 * mV, interpolate=False):
+    found = spikes(v, threshold)
+    return {'rc_spikes': found.sum(axis=1),
+            'rc_first_spike': _first(t, v, found, threshold, interpolate),
+            'rc_peak_v': peak(t, v, interpolate=interpolate)}
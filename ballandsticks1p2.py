@@ -15,20 +15,20 @@
 
 from neuron import h
 from neuron.units import mV
-import LFPy
+import geometry
+import nrnmech
+nrnmech.load()
 h.load_file('stdrun.hoc')
 
-class Interneuron(LFPy.TemplateCell):
+class Interneuron:
     
     # constructor 
     def __init__(self, gid, x, y, z, theta):
         self._gid = gid 
         self._setup_morphology()
         self._setup_biophysics()
-        self.x = self.y = self.z = 0
-        h.define_shape()
-        self._rotate_z(theta)                             
-        self._set_position(x, y, z)                     
+        _define_shape(self, 'Interneuron', theta, (x, y, z))
+        self.x, self.y, self.z = x, y, z
         
         
     # morphology
@@ -49,13 +49,18 @@ class Interneuron(LFPy.TemplateCell):
         self.soma.diam = 17.4 
         self.axon_p.nseg = 11
         self.axon_p.L = 100
-        taper_diam(self.axon_p,4,0.3)
+        # only the cell whose shape define_shape takes needs the tapers,
+        # later cells copy its 3D points and with them the diameters
+        tapered = 'Interneuron' not in _SHAPES
+        if tapered:
+            taper_diam(self.axon_p,4,0.3)
         self.axon_d.nseg = 11
         self.axon_d.L = 400 
         self.axon_d.diam = 0.3 
         self.dend_p.nseg = 11
         self.dend_p.L = 100
-        taper_diam(self.dend_p,4,0.3)
+        if tapered:
+            taper_diam(self.dend_p,4,0.3)
         self.dend_d.nseg = 11 
         self.dend_d.L = 400 
         self.dend_d.diam = 0.3 
@@ -65,27 +70,25 @@ class Interneuron(LFPy.TemplateCell):
         for sec in self.all: 
             sec.Ra = 113
             sec.cm = 1.1
+        # range variables set on a section apply to all of its segments
         self.soma.insert('hh') # Hodgkin-Huxley kinetics
-        for seg in self.soma:                       
-            seg.hh.gnabar = 0.5  
-            seg.hh.gkbar = 0.1  
-            seg.hh.gl = 0.0003       
-            seg.hh.el = (-54.3*mV) # Nernst potential
+        self.soma.gnabar_hh = 0.5  
+        self.soma.gkbar_hh = 0.1  
+        self.soma.gl_hh = 0.0003       
+        self.soma.el_hh = (-54.3*mV) # Nernst potential
         self.soma.insert('pas')
-        for seg in self.soma:
-            seg.pas.g = 0.0001 
-            seg.pas.e = -60*mV    
+        self.soma.g_pas = 0.0001 
+        self.soma.e_pas = -60*mV    
          
-        for sec in [self.dend_p,self.dend_d,self.axon_p,self.axon_d]:
+        for sec in self.exc_soma:
             sec.insert('pas') # Passive membrane properties
             sec.insert('hh')
-            for seg in sec:
-                seg.pas.g = 0.005  
-                seg.pas.e = (-65*mV) 
-                seg.hh.gnabar = 0.5  # arbitrarily chosen
-                seg.hh.gkbar = 0.1  
-                seg.hh.gl = 0.0003       
-                seg.hh.el = (-54.3*mV) # 
+            sec.g_pas = 0.005  
+            sec.e_pas = (-65*mV) 
+            sec.gnabar_hh = 0.5  # arbitrarily chosen
+            sec.gkbar_hh = 0.1  
+            sec.gl_hh = 0.0003       
+            sec.el_hh = (-54.3*mV) # 
                 
         for sec in self.all: # add rest of ion channel types
             sec.insert('iar')
@@ -105,38 +108,27 @@ class Interneuron(LFPy.TemplateCell):
     
     # position in 3D space
     def _set_position(self, x, y, z):
-        for sec in self.all: 
-            for i in range(sec.n3d()): 
-                sec.pt3dchange(i,
-                               x - self.x + sec.x3d(i),
-                               y - self.y + sec.y3d(i),
-                               z - self.z + sec.z3d(i),
-                              sec.diam3d(i))
+        geometry.transform(self.all, offset=(x - self.x, y - self.y, z - self.z))
         self.x, self.y, self.z = x, y, z
         
     # rotate cell about z-axis
     def _rotate_z(self, theta):
-        for sec in self.all:
-            for i in range(sec.n3d()):
-                x = sec.x3d(i)
-                y = sec.y3d(i)
-                c = h.cos(theta)
-                s = h.sin(theta)
-                xprime = x * c - y * s
-                yprime = x * s + y * c
-                sec.pt3dchange(i, xprime, yprime, sec.z3d(i), sec.diam3d(i))
+        geometry.transform(self.all, theta=theta)
+        
+    # rotate about z-axis and move to (x, y, z) in a single pass over the points
+    def _place(self, theta, x, y, z):
+        geometry.transform(self.all, theta, (x - self.x, y - self.y, z - self.z))
+        self.x, self.y, self.z = x, y, z
                 
-class RelayCell(LFPy.TemplateCell):
+class RelayCell:
     
     # constructor 
     def __init__(self, gid, x, y, z, theta):
         self._gid = gid
         self._setup_morphology()
         self._setup_biophysics()
-        self.x = self.y = self.z = 0
-        h.define_shape()
-        self._rotate_z(theta)                             
-        self._set_position(x, y, z)                     
+        _define_shape(self, 'RelayCell', theta, (x, y, z))
+        self.x, self.y, self.z = x, y, z
         
         
     # morphology
@@ -153,15 +145,13 @@ class RelayCell(LFPy.TemplateCell):
             sec.Ra = 1000
             sec.cm = 1 
         self.soma.insert('hh')                                   
-        for seg in self.soma:                            
-            seg.hh.gnabar = 0.1
-            seg.hh.gkbar = 0.025  
-            seg.hh.gl = 0.0001
-            seg.hh.el = -54.3*mV
+        self.soma.gnabar_hh = 0.1
+        self.soma.gkbar_hh = 0.025  
+        self.soma.gl_hh = 0.0001
+        self.soma.el_hh = -54.3*mV
         self.soma.insert('pas')
-        for seg in self.soma:
-            seg.pas.g = 0.0001 
-            seg.pas.e = -60*mV    
+        self.soma.g_pas = 0.0001 
+        self.soma.e_pas = -60*mV    
             
         for sec in self.all: # add rest of ion channel types
             sec.insert('iar')
@@ -180,26 +170,38 @@ class RelayCell(LFPy.TemplateCell):
     
     # specify position in 3D space
     def _set_position(self, x, y, z):
-        for sec in self.all: 
-            for i in range(sec.n3d()): 
-                sec.pt3dchange(i,
-                               x - self.x + sec.x3d(i),
-                               y - self.y + sec.y3d(i),
-                               z - self.z + sec.z3d(i),
-                              sec.diam3d(i))
+        geometry.transform(self.all, offset=(x - self.x, y - self.y, z - self.z))
         self.x, self.y, self.z = x, y, z
         
     # rotate cell about z-axis
     def _rotate_z(self, theta):
-        for sec in self.all:
-            for i in range(sec.n3d()):
-                x = sec.x3d(i)
-                y = sec.y3d(i)
-                c = h.cos(theta)
-                s = h.sin(theta)
-                xprime = x * c - y * s
-                yprime = x * s + y * c
-                sec.pt3dchange(i, xprime, yprime, sec.z3d(i), sec.diam3d(i))
+        geometry.transform(self.all, theta=theta)
+        
+    # rotate about z-axis and move to (x, y, z) in a single pass over the points
+    def _place(self, theta, x, y, z):
+        geometry.transform(self.all, theta, (x - self.x, y - self.y, z - self.z))
+        self.x, self.y, self.z = x, y, z
+
+
+# 3D points of each kind of cell, relative to the start of its soma
+_SHAPES = {}
+
+# give the sections of a new cell their 3D points, rotated by theta about
+# the z-axis and moved to offset. h.define_shape() visits every section in
+# the model, so it only runs for the first cell of each kind; later cells
+# copy the points of that first cell
+def _define_shape(cell, kind, theta=0, offset=(0, 0, 0)):
+    shape = _SHAPES.get(kind)
+    if shape is None:
+        h.define_shape()
+        # define_shape stacks cells along z, move this one back to the origin
+        origin = geometry.get_points(cell.soma)[0, :3]
+        shape = [geometry.get_points(sec) for sec in cell.all]
+        for points in shape:
+            points[:, :3] -= origin
+        _SHAPES[kind] = shape
+    for sec, points in zip(cell.all, shape):
+        geometry.set_points(sec, geometry.transformed(points, theta, offset))
 
      
 def taper_diam(sec,zero_bound,one_bound):
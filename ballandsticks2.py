@@ -3,11 +3,11 @@
 # -----------------------------------------------------------------------------
 # Patrick McCarthy, Laura Lazzari and Jonathan Martin, March 2020 
 # ----------------------------------------------------------------------------- 
-# This file defines classes for an LGN interneuron with 3 dendrites and a 
-# 1 axon, to be used in conjunction with the file 'model2.py' to simulate a
-# small mouse LGN network with 3 RCG inputs to a relay cell, which is
-# inhibited by the interneuron via axosomatic (F1) and triadic (F2) inhibitory
-# synapses.
+# This file defines classes for an LGN interneuron with 3 dendrites (or any
+# other number, see 'network.py') and 1 axon, to be used in conjunction with
+# the file 'model2.py' to simulate a small mouse LGN network with 3 RCG
+# inputs to a relay cell, which is inhibited by the interneuron via
+# axosomatic (F1) and triadic (F2) inhibitory synapses.
 # -----------------------------------------------------------------------------
 # We thank Prof. Gaute Einevoll, Dr. Thomas Heiberg and Dr. Geir Halnes for
 # providing us with the code on which we based this model.
@@ -15,96 +15,106 @@
 
 from neuron import h
 from neuron.units import mV
-import LFPy
+import geometry
+import nrnmech
+nrnmech.load()
 h.load_file('stdrun.hoc')
 
-class Interneuron(LFPy.TemplateCell):
+# segments of each part of the reduced interneuron and the scales of the
+# axial resistance and leak of its neurites, fitted with 'reduction.py'
+REDUCED = {'soma_nseg': 1, 'proximal_nseg': 1, 'distal_nseg': 5,
+           'dend_ra_scale': 1.247, 'axon_ra_scale': 0.83, 'g_pas_scale': 0.75}
+
+class Interneuron:
     
-    # constructor 
-    def __init__(self, gid, x, y, z, theta):
+    # constructor; the published model hangs the last distal dendrite from
+    # the end of the proximal dendrite before it (dend3_d on dend2_p), which
+    # corrected_wiring=True replaces by its own proximal dendrite
+    def __init__(self, gid, x, y, z, theta, ndend=3, d_lambda=None, corrected_wiring=False):
         self._gid = gid 
+        self._ndend = ndend
+        self.corrected_wiring = corrected_wiring
+        self._shape = ('Interneuron', ndend, corrected_wiring)
         self._setup_morphology()
         self._setup_biophysics()
-        self.x = self.y = self.z = 0
-        h.define_shape()
-        self._rotate_z(theta)                             
-        self._set_position(x, y, z)                     
+        _define_shape(self, self._shape, theta, (x, y, z))
+        self.x, self.y, self.z = x, y, z
+        if d_lambda is not None: # nseg by the d_lambda rule instead of 11
+            geometry.set_nseg(self.all, d_lambda)
         
     # morphology
     def _setup_morphology(self): 
         self.soma = h.Section(name='soma', cell=self)
         self.axon_p = h.Section(name='proximal_part_of_axon',cell=self)
         self.axon_d = h.Section(name='distal_part_of_axon',cell=self)
-        self.dend1_p = h.Section(name='proximal_part_of_dendrite 1',cell=self)
-        self.dend1_d = h.Section(name='distal_part_of_dendrite 1',cell=self)
-        self.dend2_p = h.Section(name='proximal_part_of_dendrite 2',cell=self)
-        self.dend2_d = h.Section(name='distal_part_of_dendrite 2',cell=self)
-        self.dend3_p = h.Section(name='proximal_part_of_dendrite 3',cell=self)
-        self.dend3_d = h.Section(name='distal_part_of_dendrite 3',cell=self)
-        self.all = [self.soma, self.axon_p, self.axon_d, self.dend1_p, self.dend1_d, self.dend2_p, self.dend2_d, self.dend3_p, self.dend3_d]
-        self.exc_soma = [self.axon_p, self.axon_p, self.axon_d, self.dend1_p, self.dend1_d, self.dend2_p, self.dend2_d, self.dend3_p, self.dend3_d]
+        self.dend_p = []
+        self.dend_d = []
+        for k in range(1, self._ndend + 1):
+            dend_p = h.Section(name='proximal_part_of_dendrite {}'.format(k),cell=self)
+            dend_d = h.Section(name='distal_part_of_dendrite {}'.format(k),cell=self)
+            # keep the dend1_p, dend1_d, ... names used by the model scripts
+            setattr(self, 'dend{}_p'.format(k), dend_p)
+            setattr(self, 'dend{}_d'.format(k), dend_d)
+            self.dend_p.append(dend_p)
+            self.dend_d.append(dend_d)
+        self.dends = [sec for pair in zip(self.dend_p, self.dend_d) for sec in pair]
+        self.all = [self.soma, self.axon_p, self.axon_d] + self.dends
+        self.exc_soma = [self.axon_p, self.axon_d] + self.dends
         self.axon_p.connect(self.soma(0))
         self.axon_d.connect(self.axon_p(1))
-        self.dend1_p.connect(self.soma(0.3)) 
-        self.dend1_d.connect(self.dend1_p(1))
-        self.dend2_p.connect(self.soma(0.6)) 
-        self.dend2_d.connect(self.dend2_p(1))
-        self.dend3_p.connect(self.soma(0.9)) 
-        self.dend3_d.connect(self.dend2_p(1))
+        for k, (dend_p, dend_d) in enumerate(zip(self.dend_p, self.dend_d)):
+            # proximal dendrites are spread evenly along the soma (0.3, 0.6, 0.9 for 3)
+            dend_p.connect(self.soma(0.9 * (k + 1) / self._ndend))
+            if k == self._ndend - 1 and k > 0 and not self.corrected_wiring:
+                dend_d.connect(self.dend_p[k - 1](1)) # as dend3_d in the published model
+            else:
+                dend_d.connect(dend_p(1))
         self.soma.nseg = 11
         self.soma.L = 15.3 
         self.soma.diam = 17.4 
         self.axon_p.nseg = 11
         self.axon_p.L = 100
-        taper_diam(self.axon_p,4,0.3)
+        # only the cell whose shape define_shape takes needs the tapers,
+        # later cells copy its 3D points and with them the diameters
+        tapered = self._shape not in _SHAPES
+        if tapered:
+            taper_diam(self.axon_p,4,0.3)
         self.axon_d.nseg = 11
         self.axon_d.L = 400 
         self.axon_d.diam = 0.3 
-        self.dend1_p.nseg = 11
-        self.dend1_p.L = 100
-        taper_diam(self.dend1_p,4,0.3)
-        self.dend1_d.nseg = 11 
-        self.dend1_d.L = 400 
-        self.dend1_d.diam = 0.3 
-        self.dend2_p.nseg = 11
-        self.dend2_p.L = 100
-        taper_diam(self.dend2_p,4,0.3)
-        self.dend2_d.nseg = 11 
-        self.dend2_d.L = 400 
-        self.dend2_d.diam = 0.3 
-        self.dend3_p.nseg = 11
-        self.dend3_p.L = 100
-        taper_diam(self.dend3_p,4,0.3)
-        self.dend3_d.nseg = 11 
-        self.dend3_d.L = 400 
-        self.dend3_d.diam = 0.3 
+        for dend_p, dend_d in zip(self.dend_p, self.dend_d):
+            dend_p.nseg = 11
+            dend_p.L = 100
+            if tapered:
+                taper_diam(dend_p,4,0.3)
+            dend_d.nseg = 11 
+            dend_d.L = 400 
+            dend_d.diam = 0.3 
     
     # biophysics
     def _setup_biophysics(self):
         for sec in self.all: 
             sec.Ra = 250
             sec.cm = 1
+        # range variables set on a section apply to all of its segments
         self.soma.insert('hh') # Hodgkin-Huxley kinetics
-        for seg in self.soma:                       
-            seg.hh.gnabar = 0.05  
-            seg.hh.gkbar = 0.05  
-            seg.hh.gl = 0.0003       
-            seg.hh.el = (-50*mV) # Nernst potential
+        self.soma.gnabar_hh = 0.05  
+        self.soma.gkbar_hh = 0.05  
+        self.soma.gl_hh = 0.0003       
+        self.soma.el_hh = (-50*mV) # Nernst potential
         self.soma.insert('pas')
-        for seg in self.soma:
-            seg.pas.g = 0.0001 
-            seg.pas.e = -60*mV    
+        self.soma.g_pas = 0.0001 
+        self.soma.e_pas = -60*mV    
          
         for sec in self.exc_soma:
             sec.insert('pas') # Passive membrane properties
             sec.insert('hh')
-            for seg in sec:
-                seg.pas.g = 0.005  
-                seg.pas.e = (-65*mV) 
-                seg.hh.gnabar = 0.5  # arbitrarily chosen
-                seg.hh.gkbar = 0.1  
-                seg.hh.gl = 0.0003       
-                seg.hh.el = (-50*mV) # 
+            sec.g_pas = 0.005  
+            sec.e_pas = (-65*mV) 
+            sec.gnabar_hh = 0.5  # arbitrarily chosen
+            sec.gkbar_hh = 0.1  
+            sec.gl_hh = 0.0003       
+            sec.el_hh = (-50*mV) # 
                 
         for sec in self.all: # add rest of ion channel types
             sec.insert('iar')
@@ -124,38 +134,29 @@ class Interneuron(LFPy.TemplateCell):
     
     # position in 3D space
     def _set_position(self, x, y, z):
-        for sec in self.all: 
-            for i in range(sec.n3d()): 
-                sec.pt3dchange(i,
-                               x - self.x + sec.x3d(i),
-                               y - self.y + sec.y3d(i),
-                               z - self.z + sec.z3d(i),
-                              sec.diam3d(i))
+        geometry.transform(self.all, offset=(x - self.x, y - self.y, z - self.z))
         self.x, self.y, self.z = x, y, z
         
     # rotate cell about z-axis
     def _rotate_z(self, theta):
-        for sec in self.all:
-            for i in range(sec.n3d()):
-                x = sec.x3d(i)
-                y = sec.y3d(i)
-                c = h.cos(theta)
-                s = h.sin(theta)
-                xprime = x * c - y * s
-                yprime = x * s + y * c
-                sec.pt3dchange(i, xprime, yprime, sec.z3d(i), sec.diam3d(i))
+        geometry.transform(self.all, theta=theta)
+        
+    # rotate about z-axis and move to (x, y, z) in a single pass over the points
+    def _place(self, theta, x, y, z):
+        geometry.transform(self.all, theta, (x - self.x, y - self.y, z - self.z))
+        self.x, self.y, self.z = x, y, z
                 
-class RelayCell(LFPy.TemplateCell):
+class RelayCell:
     
     # constructor 
-    def __init__(self, gid, x, y, z, theta):
+    def __init__(self, gid, x, y, z, theta, d_lambda=None):
         self._gid = gid
         self._setup_morphology()
         self._setup_biophysics()
-        self.x = self.y = self.z = 0
-        h.define_shape()
-        self._rotate_z(theta)                             
-        self._set_position(x, y, z)                     
+        _define_shape(self, 'RelayCell', theta, (x, y, z))
+        self.x, self.y, self.z = x, y, z
+        if d_lambda is not None: # nseg by the d_lambda rule instead of 11
+            geometry.set_nseg(self.all, d_lambda)
         
         
     # morphology
@@ -172,15 +173,13 @@ class RelayCell(LFPy.TemplateCell):
             sec.Ra = 1000
             sec.cm = 1 
         self.soma.insert('hh')                                   
-        for seg in self.soma:                            
-            seg.hh.gnabar = 0.1
-            seg.hh.gkbar = 0.025  
-            seg.hh.gl = 0.0001
-            seg.hh.el = -50*mV
+        self.soma.gnabar_hh = 0.1
+        self.soma.gkbar_hh = 0.025  
+        self.soma.gl_hh = 0.0001
+        self.soma.el_hh = -50*mV
         self.soma.insert('pas')
-        for seg in self.soma:
-            seg.pas.g = 0.0001 
-            seg.pas.e = -60*mV    
+        self.soma.g_pas = 0.0001 
+        self.soma.e_pas = -60*mV    
             
         for sec in self.all: # add rest of ion channel types
             sec.insert('iar')
@@ -199,26 +198,68 @@ class RelayCell(LFPy.TemplateCell):
     
     # specify position in 3D space
     def _set_position(self, x, y, z):
-        for sec in self.all: 
-            for i in range(sec.n3d()): 
-                sec.pt3dchange(i,
-                               x - self.x + sec.x3d(i),
-                               y - self.y + sec.y3d(i),
-                               z - self.z + sec.z3d(i),
-                              sec.diam3d(i))
+        geometry.transform(self.all, offset=(x - self.x, y - self.y, z - self.z))
         self.x, self.y, self.z = x, y, z
         
     # rotate cell about z-axis
     def _rotate_z(self, theta):
-        for sec in self.all:
-            for i in range(sec.n3d()):
-                x = sec.x3d(i)
-                y = sec.y3d(i)
-                c = h.cos(theta)
-                s = h.sin(theta)
-                xprime = x * c - y * s
-                yprime = x * s + y * c
-                sec.pt3dchange(i, xprime, yprime, sec.z3d(i), sec.diam3d(i))
+        geometry.transform(self.all, theta=theta)
+        
+    # rotate about z-axis and move to (x, y, z) in a single pass over the points
+    def _place(self, theta, x, y, z):
+        geometry.transform(self.all, theta, (x - self.x, y - self.y, z - self.z))
+        self.x, self.y, self.z = x, y, z
+
+
+class ReducedInterneuron(Interneuron):
+
+    # constructor: an Interneuron with the same sections but few segments
+    # (25 instead of 99 with 3 dendrites), with neurite properties fitted so
+    # that its inhibitory outputs keep their timing; settings replace
+    # entries of REDUCED
+    def __init__(self, gid, x, y, z, theta, ndend=3, corrected_wiring=False, **settings):
+        unknown = sorted(set(settings) - set(REDUCED))
+        if unknown:
+            raise ValueError('unknown settings {}, expected some of {}'.format(
+                unknown, sorted(REDUCED)))
+        self.settings = dict(REDUCED, **settings)
+        super().__init__(gid, x, y, z, theta, ndend, corrected_wiring=corrected_wiring)
+        s = self.settings
+        self.soma.nseg = s['soma_nseg']
+        for sec in [self.axon_p] + self.dend_p:
+            sec.nseg = s['proximal_nseg']
+        for sec in [self.axon_d] + self.dend_d:
+            sec.nseg = s['distal_nseg']
+        for sec in (self.axon_p, self.axon_d):
+            sec.Ra *= s['axon_ra_scale']
+        for sec in self.dends:
+            sec.Ra *= s['dend_ra_scale']
+        for sec in self.exc_soma:
+            sec.g_pas *= s['g_pas_scale']
+
+    def __repr__(self):
+        return 'ReducedInterneuron[{}]'.format(self._gid)
+
+
+# 3D points of each kind of cell, relative to the start of its soma
+_SHAPES = {}
+
+# give the sections of a new cell their 3D points, rotated by theta about
+# the z-axis and moved to offset. h.define_shape() visits every section in
+# the model, so it only runs for the first cell of each kind; later cells
+# copy the points of that first cell
+def _define_shape(cell, kind, theta=0, offset=(0, 0, 0)):
+    shape = _SHAPES.get(kind)
+    if shape is None:
+        h.define_shape()
+        # define_shape stacks cells along z, move this one back to the origin
+        origin = geometry.get_points(cell.soma)[0, :3]
+        shape = [geometry.get_points(sec) for sec in cell.all]
+        for points in shape:
+            points[:, :3] -= origin
+        _SHAPES[kind] = shape
+    for sec, points in zip(cell.all, shape):
+        geometry.set_points(sec, geometry.transformed(points, theta, offset))
 
      
 def taper_diam(sec,zero_bound,one_bound):
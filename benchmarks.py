@@ -0,0 +1,553 @@
+# =============================================================================
+# BENCHMARKS
+# -----------------------------------------------------------------------------
+# Timing benchmarks for building and running the model. The mechanisms are
+# built and loaded by 'nrnmech.py', e.g.
+#
+#     python benchmarks.py
+#
+# 'benchsuite.py' times every model variant stage by stage and writes json
+# for comparing commits.
+# =============================================================================
+
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from neuron import h
+
+import analysis
+import ballandsticks2 as bs2
+import branch
+import geometry
+import lfp
+import network
+import population
+import profiling
+import recording
+import snapshot
+import stimuli
+import surface
+import sweep
+import tables
+
+
+PRESETS = {'netstim': network.MODEL2, 'iclamp': network.MODEL3, 'alpha': network.MODEL4}
+
+
+# a preset with the first triad's value of every parameter applied to all triads
+def _uniform(params):
+    return {key: value[0] if isinstance(value, list) else value
+            for key, value in params.items()}
+
+
+# time to build a circuit with each number of triads
+def bench_triads(sizes=(10, 100, 1000), input='netstim', repeat=3):
+    params = _uniform(PRESETS[input])
+    results = []
+    for ntriads in sizes:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            circuit = network.TriadCircuit(params, ntriads=ntriads)
+            best = min(best, time.perf_counter() - start)
+            del circuit
+        results.append({'ntriads': ntriads, 'build_s': best,
+                        'per_triad_ms': 1e3 * best / ntriads})
+    return results
+
+
+# the point by point rotation and translation that geometry.transform replaced
+def _rotate_z_loop(cell, theta):
+    for sec in cell.all:
+        for i in range(sec.n3d()):
+            x = sec.x3d(i)
+            y = sec.y3d(i)
+            c = h.cos(theta)
+            s = h.sin(theta)
+            xprime = x * c - y * s
+            yprime = x * s + y * c
+            sec.pt3dchange(i, xprime, yprime, sec.z3d(i), sec.diam3d(i))
+
+
+def _set_position_loop(cell, x, y, z):
+    for sec in cell.all:
+        for i in range(sec.n3d()):
+            sec.pt3dchange(i,
+                           x - cell.x + sec.x3d(i),
+                           y - cell.y + sec.y3d(i),
+                           z - cell.z + sec.z3d(i),
+                           sec.diam3d(i))
+    cell.x, cell.y, cell.z = x, y, z
+
+
+# time to rotate and place ncells cells point by point and in bulk
+def bench_geometry(ncells=(100, 1000)):
+    results = []
+    for n in ncells:
+        cells = [cls(i, 0, 0, 0, 0) for i in range(n // 2) for cls in (bs2.Interneuron, bs2.RelayCell)]
+        start = time.perf_counter()
+        for i, cell in enumerate(cells):
+            _rotate_z_loop(cell, 0.1 * i)
+            _set_position_loop(cell, i, 2 * i, 3 * i)
+        loop = time.perf_counter() - start
+        start = time.perf_counter()
+        for i, cell in enumerate(cells):
+            geometry.transform(cell.all, 0.1 * i, (-i, -2 * i, -3 * i))
+        bulk = time.perf_counter() - start
+        results.append({'cells': len(cells), 'loop_s': loop, 'bulk_s': bulk,
+                        'speedup': loop / bulk})
+        del cells
+    return results
+
+
+# time to create ncells identical interneurons, copying the shape of the
+# first one or (shared=False) running define_shape for every cell as before
+def bench_cells(sizes=(100, 1000, 10000), shared=True):
+    results = []
+    for ncells in sizes:
+        bs2._SHAPES.clear()
+        cells = []
+        start = time.perf_counter()
+        for i in range(ncells):
+            if not shared:
+                bs2._SHAPES.clear()
+            cells.append(bs2.Interneuron(i, 0, 0, 0, 0))
+        elapsed = time.perf_counter() - start
+        results.append({'cells': ncells, 'shape': 'shared' if shared else 'per cell',
+                        'build_s': elapsed, 'per_cell_ms': 1e3 * elapsed / ncells})
+        del cells
+    return results
+
+
+# times at which v crosses threshold upwards, interpolated between samples
+def _crossings(t, v):
+    return analysis.spike_times(t, v, interpolate=True)[0]
+
+
+# step counts, run time and error against fixed steps of dt of the variable
+# time step methods (fixed steps of dt / 5 are shown for comparison)
+def bench_cvode(input='netstim', tstops=(40, 1000), dt=0.025, atols=(1e-3, 1e-5)):
+    runs = [('fixed', dt, None), ('fixed', dt / 5, None)]
+    runs += [(method, dt, atol) for method in ('cvode', 'lvardt') for atol in atols]
+    results = []
+    for tstop in tstops:
+        reference = None
+        for method, step, atol in runs:
+            circuit = network.TriadCircuit(PRESETS[input])
+            # an extra recording at every step of each cell counts the steps
+            steps = [h.Vector().record(sec(0.5)._ref_v, sec=sec)
+                     for sec in (circuit.interneuron.soma, circuit.relaycell.soma)]
+            start = time.perf_counter()
+            traces = circuit.run(tstop, step, method=method, atol=atol or 1e-3)
+            elapsed = time.perf_counter() - start
+            if reference is None:
+                reference = dict(traces, run_s=elapsed)
+            # compare on the samples of the reference
+            sample = int(round(dt / step))
+            v_err = max(np.abs(traces[name][::sample] - reference[name]).max()
+                        for name in ('v_rc', 'v_in', 'v_axon'))
+            spike_err = 0
+            for name in ('v_rc', 'v_in', 'v_axon'):
+                a = _crossings(traces['t'], traces[name])
+                b = _crossings(reference['t'], reference[name])
+                spike_err = max(spike_err, np.abs(a - b).max(initial=0)
+                                if len(a) == len(b) else np.inf)
+            results.append({'tstop': tstop, 'method': method, 'dt': step,
+                            'atol': atol or '-', 'in_steps': int(steps[0].size()) - 1,
+                            'rc_steps': int(steps[1].size()) - 1, 'run_s': elapsed,
+                            'speedup': reference['run_s'] / elapsed,
+                            'max_v_err': v_err, 'spike_err': spike_err})
+            del circuit, steps
+    recording.set_method('fixed')
+    return results
+
+
+# run time and error of rate tables against exact rates
+def bench_tables(tstop=1000, ranges=((-100, 100), (-90, 60))):
+    results = []
+    for input, params in PRESETS.items():
+        for vmin, vmax in ranges:
+            errors = tables.validate(params, tstop, vmin=vmin, vmax=vmax)
+            results.append({'input': input, 'vmin': vmin, 'vmax': vmax,
+                            'resolution': errors['resolution'],
+                            'exact_s': errors['exact_s'], 'table_s': errors['table_s'],
+                            'speedup': errors['speedup'],
+                            'max_v_err': max(errors[name + '_max_err']
+                                             for name in ('v_rc', 'v_in', 'v_axon')),
+                            'spike_err': max(errors[name + '_spike_err']
+                                             for name in ('v_rc', 'v_in', 'v_axon'))})
+    return results
+
+
+# segments, run time and spike timing with nseg = 11 (d_lambda None) and
+# nseg by the d_lambda rule, against the last (finest) d_lambda
+def bench_d_lambda(input='netstim', values=(None, 0.3, 0.1, 0.05, 0.02), tstop=200):
+    runs = []
+    for d_lambda in values:
+        circuit = network.TriadCircuit(dict(PRESETS[input], d_lambda=d_lambda))
+        nseg = sum(sec.nseg for sec in circuit.interneuron.all + circuit.relaycell.all)
+        start = time.perf_counter()
+        traces = circuit.run(tstop)
+        runs.append((d_lambda, nseg, time.perf_counter() - start, traces))
+        del circuit
+    reference = runs[-1][3]
+    results = []
+    for d_lambda, nseg, elapsed, traces in runs:
+        spike_err = 0
+        for name in ('v_rc', 'v_in', 'v_axon'):
+            a = _crossings(traces['t'], traces[name])
+            b = _crossings(reference['t'], reference[name])
+            spike_err = max(spike_err, np.abs(a - b).max(initial=0)
+                            if len(a) == len(b) else np.inf)
+        results.append({'d_lambda': d_lambda if d_lambda is not None else '-',
+                        'nseg': nseg, 'run_s': elapsed,
+                        'speedup': runs[0][2] / elapsed, 'spike_err': spike_err})
+    return results
+
+
+# time to import each module in a fresh interpreter, as every sweep worker
+# does; LFPy is what importing the cell classes used to cost on top
+def bench_startup(modules=('neuron', 'ballandsticks2', 'network', 'sweep', 'LFPy'),
+                  repeat=3):
+    code = ('import time; start = time.perf_counter(); import {}; '
+            'print(time.perf_counter() - start)')
+    results = []
+    for module in modules:
+        best = float('inf')
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, '-c', code.format(module)],
+                                    capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            best = min(best, float(output.stdout.split()[-1]))
+        results.append({'module': module, 'import_s': best,
+                        'lfpy_loaded': module == 'LFPy' or _imports_lfpy(module)})
+    return results
+
+
+def _imports_lfpy(module):
+    code = 'import sys, {}; print("LFPy" in sys.modules)'.format(module)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return output.stdout.split()[-1] == 'True'
+
+
+# sweep throughput with each number of worker processes
+def bench_sweep(npoints=32, processes=(1, 2, 4, 8), tstop=40):
+    points = [{'onset2': 5 + 0.1 * i} for i in range(npoints)]
+    results = []
+    for nproc in processes:
+        start = time.perf_counter()
+        sweep.run_sweep(points, base=network.MODEL3, tstop=tstop, processes=nproc)
+        elapsed = time.perf_counter() - start
+        results.append({'processes': nproc, 'sweep_s': elapsed,
+                        'runs_per_s': npoints / elapsed})
+    return results
+
+
+# run time of populations of 100 to 1000 cells with each number of threads
+def bench_threads(sizes=(50, 500), threads=(1, 2, 4, 8), tstop=20):
+    results = []
+    for ncircuits in sizes:
+        pop = population.Population(ncircuits, network.MODEL2)
+        serial = None
+        for nthread in threads:
+            start = time.perf_counter()
+            pop.run(tstop, nthread=nthread)
+            elapsed = time.perf_counter() - start
+            serial = serial or elapsed
+            results.append({'cells': pop.ncells(), 'threads': nthread,
+                            'run_s': elapsed, 'speedup': serial / elapsed})
+        del pop
+    return results
+
+
+# sweeps started from rest, warming up before every run against restoring
+# the state saved by the first, and the largest difference between the two;
+# MODEL2 sweeps NetStim inputs, which once crashed after a few restores
+def bench_snapshot(npoints=10, warmup=1000, tstop=40):
+    sweeps = {'MODEL3 onsets': [network.update_params(network.MODEL3, onset2=5 + 0.5 * i)
+                                for i in range(npoints)],
+              'MODEL2 weights': [network.update_params(network.MODEL2, in_exc_weight=0.1 * i,
+                                                       rc_exc_tau2=2 + 0.2 * i)
+                                 for i in range(npoints)]}
+    path = tempfile.mkdtemp()
+    states = snapshot.StateCache(path, warmup=warmup)
+    results = []
+    try:
+        for name, points in sweeps.items():
+            for start_from in ('warm-up per run', 'saved state'):
+                start = time.perf_counter()
+                runs = []
+                for params in points:
+                    if start_from == 'saved state':
+                        runs.append(states.simulate(params, tstop))
+                        continue
+                    circuit = network.TriadCircuit(params)
+                    runs.append(circuit.run(tstop, state=snapshot.warm_up(warmup)))
+                    del circuit
+                elapsed = time.perf_counter() - start
+                first, diff = elapsed, 0.0
+                if start_from == 'saved state':
+                    first = results[-1]['total_s']
+                    diff = max(np.abs(a[key] - b[key]).max() for a, b in zip(warmed, runs)
+                               for key in ('v_rc', 'v_in', 'v_axon'))
+                warmed = runs
+                results.append({'sweep': name, 'start': start_from, 'npoints': npoints,
+                                'total_s': elapsed, 'speedup': first / elapsed,
+                                'max_diff': diff})
+    finally:
+        shutil.rmtree(path)
+    return results
+
+
+# an onset sweep of MODEL3 run point by point against branching from one
+# checkpoint at the earliest onset that varies
+def bench_branches(onsets=(15, 20, 25, 30), tstop=40):
+    points = sweep.grid(onset2=onsets, onset3=onsets)
+    tables = [network.make_table(network.update_params(network.MODEL3, **point), 3)
+              for point in points]
+    fork = branch.fork_time(tables)
+    results = []
+    for mode in ('point by point', 'branching'):
+        start = time.perf_counter()
+        if mode == 'branching':
+            branch.run_branches(points, tstop=tstop)
+            simulated = fork + len(points) * (tstop - fork)
+        else:
+            sweep.run_sweep(points, tstop=tstop, processes=1)
+            simulated = len(points) * tstop
+        elapsed = time.perf_counter() - start
+        results.append({'mode': mode, 'npoints': len(points), 'simulated_ms': simulated,
+                        'total_s': elapsed,
+                        'speedup': results[0]['total_s'] / elapsed if results else 1})
+    return results
+
+
+# relay cell measures of many runs, one run at a time against all at once;
+# the runs are copies of a MODEL4 run with a little noise added
+def bench_analysis(sizes=(1000, 10000, 30000), tstop=60):
+    traces = network.simulate(network.MODEL4, tstop)
+    rng = np.random.default_rng(0)
+    results = []
+    for nruns in sizes:
+        v = traces['v_rc'] + rng.normal(0, 0.5, (nruns, len(traces['t'])))
+        start = time.perf_counter()
+        loop = [sweep.summarise({'t': traces['t'], 'v_rc': row}) for row in v]
+        loop_s = time.perf_counter() - start
+        start = time.perf_counter()
+        batch = analysis.summarise(traces['t'], v)
+        batch_s = time.perf_counter() - start
+        same = np.array_equal([row['rc_spikes'] for row in loop], batch['rc_spikes'])
+        results.append({'nruns': nruns, 'loop_s': loop_s, 'vectorized_s': batch_s,
+                        'speedup': loop_s / batch_s, 'same': str(same)})
+    return results
+
+
+# cost of streaming the LFP of a population to disk with each number of
+# electrode contacts (0 is a run without LFP)
+def bench_lfp(contacts=(0, 10, 100, 1000), ncircuits=10, tstop=100):
+    pop = population.Population(ncircuits, network.MODEL2)
+    path = tempfile.mkdtemp()
+    results = []
+    try:
+        for ncontacts in contacts:
+            recorders = []
+            if ncontacts:
+                points = [(0, 0, z) for z in np.linspace(-500, 500, ncontacts)]
+                recorders.append(lfp.LFPRecorder(lfp.population_cells(pop), points,
+                                                 os.path.join(path, 'lfp.npy')))
+            start = time.perf_counter()
+            pop.run(tstop, recorders=recorders)
+            elapsed = time.perf_counter() - start
+            results.append({'contacts': ncontacts, 'run_s': elapsed,
+                            'overhead': elapsed / results[0]['run_s'] if results else 1})
+    finally:
+        shutil.rmtree(path)
+    return results
+
+
+# time to set up an LFPRecorder for a population, computing the transfer
+# matrices against reading them from disk or memory
+def bench_transfer(sizes=(1, 100), ncontacts=100, repeat=3):
+    points = [(0, 0, z) for z in np.linspace(-500, 500, ncontacts)]
+    path = tempfile.mkdtemp()
+    results = []
+    try:
+        for ncircuits in sizes:
+            pop = population.Population(ncircuits, network.MODEL2)
+            cells = lfp.population_cells(pop)
+            output = os.path.join(path, 'lfp.npy')
+            times = {}
+            for source in ('computed', 'disk', 'memory'):
+                transfers = None if source == 'computed' else lfp.TransferCache(path)
+                best = float('inf')
+                for _ in range(repeat):
+                    if source == 'disk':
+                        lfp._matrices.clear()
+                    start = time.perf_counter()
+                    lfp.LFPRecorder(cells, points, output, transfers=transfers)
+                    best = min(best, time.perf_counter() - start)
+                times[source] = best
+            for source, best in times.items():
+                results.append({'ncircuits': ncircuits, 'matrix': source, 'setup_s': best,
+                                'speedup': times['computed'] / best})
+            del pop, cells
+    finally:
+        shutil.rmtree(path)
+    return results
+
+
+# time to build a circuit with NetStim inputs against VecStim inputs, and
+# to draw new Poisson trains and play them in the built circuit
+def bench_trains(sizes=(100, 1000), rate=20, tstop=1000, repeat=3):
+    results = []
+    for ntriads in sizes:
+        for input in ('netstim', 'vecstim'):
+            params = dict(_uniform(network.MODEL2), input=input)
+            build = trains = float('inf')
+            for _ in range(repeat):
+                first = stimuli.poisson(ntriads, rate, tstop) if input == 'vecstim' else None
+                start = time.perf_counter()
+                circuit = network.TriadCircuit(params, ntriads=ntriads, trains=first)
+                build = min(build, time.perf_counter() - start)
+                if input == 'vecstim':
+                    start = time.perf_counter()
+                    circuit.set_trains(stimuli.poisson(ntriads, rate, tstop))
+                    trains = min(trains, time.perf_counter() - start)
+                del circuit
+            results.append({'ntriads': ntriads, 'input': input, 'build_s': build,
+                            'new_trains_s': trains if input == 'vecstim' else 0.0})
+    return results
+
+
+# cost of running inside a Profile, with and without counting events
+def bench_profiling(tstop=200, repeat=3):
+    results = []
+    for mode in ('off', 'phases and mechanisms', 'with events'):
+        best = float('inf')
+        for _ in range(repeat):
+            profile = profiling.Profile(events=mode == 'with events')
+            with profile if mode != 'off' else contextlib.nullcontext():
+                circuit = network.TriadCircuit(network.MODEL2)
+                start = time.perf_counter()
+                circuit.run(tstop)
+                best = min(best, time.perf_counter() - start)
+            del circuit
+        results.append({'profile': mode, 'run_s': best,
+                        'overhead': best / results[0]['run_s'] if results else 1})
+    return results
+
+
+# time to build and run a circuit with the full and the reduced interneuron
+def bench_reduced(tstop=200, repeat=3):
+    results = []
+    for reduced in (None, True):
+        build = run = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            circuit = network.TriadCircuit(dict(network.MODEL2, reduced=reduced))
+            build = min(build, time.perf_counter() - start)
+            start = time.perf_counter()
+            circuit.run(tstop)
+            run = min(run, time.perf_counter() - start)
+            nseg = sum(sec.nseg for sec in circuit.interneuron.all)
+            del circuit
+        results.append({'interneuron': 'reduced' if reduced else 'full', 'nseg': nseg,
+                        'build_s': build, 'run_s': run,
+                        'speedup': results[0]['run_s'] / run if results else 1})
+    return results
+
+
+# time to fit a response surface to a weight sweep and answer queries from
+# it, against simulating the query points, the largest errors and how often
+# they are within twice the reported error
+def bench_surface(nquery=20, tstop=40, seed=0):
+    grid = sweep.grid(rc_exc_weight=list(np.linspace(0.5, 5, 6)),
+                      in_exc_weight=list(np.linspace(0.1, 1.2, 6)))
+    params = ['rc_exc_weight', 'in_exc_weight']
+    rows = sweep.run_sweep(grid, base=network.MODEL2, tstop=tstop, interpolate=True)
+    start = time.perf_counter()
+    fitted = surface.ResponseSurface(rows, params, base=network.MODEL2, tstop=tstop)
+    fit = time.perf_counter() - start
+    rng = np.random.default_rng(seed)
+    points = [{'rc_exc_weight': a, 'in_exc_weight': b}
+              for a, b in zip(rng.uniform(0.5, 5, nquery), rng.uniform(0.1, 1.2, nquery))]
+    start = time.perf_counter()
+    estimates = fitted.predict(points)
+    predict = time.perf_counter() - start
+    start = time.perf_counter()
+    simulated = sweep.run_sweep(points, base=network.MODEL2, tstop=tstop, interpolate=True)
+    simulate = time.perf_counter() - start
+    return [{'response': name, 'fit_s': fit, 'predict_s': predict, 'simulate_s': simulate,
+             'max_error': max(abs(e[name] - s[name]) for e, s in zip(estimates, simulated)),
+             'mean_err': float(np.mean([e[name + '_err'] for e in estimates])),
+             'within_2err': float(np.mean([abs(e[name] - s[name]) <= 2 * e[name + '_err']
+                                           for e, s in zip(estimates, simulated)]))}
+            for name in ('rc_first_spike', 'rc_peak_v')]
+
+
+# time to build circuits of 3 to 1000 triads against setting new parameters
+# in the built circuit, and whether its runs match those of new circuits
+def bench_reparam(sizes=(3, 100, 1000), tstop=10, repeat=3):
+    results = []
+    for ntriads in sizes:
+        params = dict(network.MODEL2, rc_exc_pos=0.5, triad_inh_pos=0.5)
+        weights = np.linspace(1, 5, ntriads)
+        build = update = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            circuit = network.TriadCircuit(params, ntriads=ntriads)
+            build = min(build, time.perf_counter() - start)
+            del circuit
+        circuit = network.TriadCircuit(params, ntriads=ntriads)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            circuit.update(rc_exc_weight=weights, in_exc_tau2=4, triad_inh_weight=5)
+            update = min(update, time.perf_counter() - start)
+        reused = circuit.run(tstop)['v_rc']
+        del circuit
+        fresh = network.TriadCircuit(dict(params, rc_exc_weight=weights, in_exc_tau2=4,
+                                          triad_inh_weight=5), ntriads=ntriads).run(tstop)['v_rc']
+        results.append({'triads': ntriads, 'build_s': build, 'update_s': update,
+                        'speedup': build / update,
+                        'identical': bool(np.array_equal(reused, fresh))})
+    return results
+
+
+def _print_table(title, rows):
+    print(title)
+    keys = list(rows[0])
+    print('  '.join('{:>14}'.format(key) for key in keys))
+    for row in rows:
+        print('  '.join('{:>14.4g}'.format(row[key]) if isinstance(row[key], float)
+                        else '{:>14}'.format(str(row[key])) for key in keys))
+    print()
+
+
+if __name__ == '__main__':
+    _print_table('startup', bench_startup())
+    _print_table('triad circuit construction', bench_triads())
+    _print_table('cell rotation and placement', bench_geometry())
+    _print_table('interneuron construction',
+                 bench_cells(sizes=(25, 50, 100), shared=False) + bench_cells())
+    _print_table('variable time steps', bench_cvode())
+    _print_table('rate tables', bench_tables())
+    _print_table('d_lambda rule', bench_d_lambda())
+    _print_table('resting state snapshots', bench_snapshot())
+    _print_table('branching onset sweeps', bench_branches())
+    _print_table('response analysis', bench_analysis())
+    _print_table('streamed LFP', bench_lfp())
+    _print_table('cached transfer matrices', bench_transfer())
+    _print_table('VecStim spike trains', bench_trains())
+    _print_table('profiling', bench_profiling())
+    _print_table('reduced interneuron', bench_reduced())
+    _print_table('response surfaces', bench_surface())
+    _print_table('in place parameters', bench_reparam())
+    _print_table('sweep throughput', bench_sweep())
+    _print_table('multithreaded populations', bench_threads())
@@ -0,0 +1,208 @@
+# =============================================================================
+# BENCHMARK SUITE
+# -----------------------------------------------------------------------------
+# This file times every model script (model1-4), every cell parameterisation
+# ('ballandsticks1p1.py', '1p2' and '2') and populations of triad circuits,
+# stage by stage: import, cell construction, synapse wiring, finitialize and
+# time steps per second, over a range of nseg, dt and population sizes.
+# Every case runs in a fresh process, so imports are timed from scratch and
+# no NEURON state is shared between cases. Results are written as json
+# together with the commit they were measured on, so that two commits can be
+# compared, e.g.
+#
+#     python benchsuite.py --out before.json
+#     (change something)
+#     python benchsuite.py --out after.json --compare before.json
+#
+# The mechanisms are loaded by 'nrnmech.py', so build them once beforehand
+# (python nrnmech.py) to keep compilation out of the timings. Times are wall
+# clock seconds; compare results from the same machine only.
+# -----------------------------------------------------------------------------
+# Population cases take construct_s and wiring_s from the phases TriadCircuit
+# marks for 'profiling.py' within one build of the population, whose whole
+# time is build_s. Cells cases build one interneuron and one relay cell:
+# construct_s is their constructors, at the nseg of 11 the modules set, and
+# build_s adds setting the nseg of the case, so construct_s does not change
+# with nseg. The scripts build their cells and synapses at import with
+# nothing marking where one ends, so they only have build_s (construct_s
+# and wiring_s are None); matplotlib.pyplot, which model2-4 import first,
+# is imported in the import stage so that build_s times the model alone.
+# =============================================================================
+
+# only the standard library is imported here; NEURON and the model are
+# imported inside each case so that their import is part of what is timed
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import time
+
+CELL_MODULES = ['ballandsticks1p1', 'ballandsticks1p2', 'ballandsticks2']
+SCRIPTS = ['model1', 'model2', 'model3', 'model4']
+
+# stages reported for every case, None where a case has no such stage
+STAGES = ['import_s', 'construct_s', 'wiring_s', 'build_s', 'init_s', 'steps_per_s']
+
+
+# every case of the suite; quick=True keeps one value of each axis
+def cases(nsegs=(11, 51, 201), dts=(0.025, 0.1), sizes=(10, 100), tstop=20,
+          quick=False):
+    if quick:
+        nsegs, dts, sizes = nsegs[:1], dts[:1], sizes[:1]
+    result = []
+    for dt in dts:
+        for name in SCRIPTS:
+            result.append({'kind': 'script', 'name': name, 'dt': dt, 'tstop': tstop})
+        for name in CELL_MODULES:
+            for nseg in nsegs:
+                result.append({'kind': 'cells', 'name': name, 'nseg': nseg,
+                               'dt': dt, 'tstop': tstop})
+        for ncircuits in sizes:
+            result.append({'kind': 'population', 'name': 'MODEL2',
+                           'ncircuits': ncircuits, 'dt': dt, 'tstop': tstop})
+    return result
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    return value, time.perf_counter() - start
+
+
+# time the stages of one case, run in a fresh worker process
+def run_case(case):
+    os.environ.setdefault('MPLBACKEND', 'Agg') # the model scripts import pyplot
+    row = dict(case, **{stage: None for stage in STAGES})
+    _, row['import_s'] = _timed(importlib.import_module, 'neuron')
+    from neuron import h
+    h.load_file('stdrun.hoc')
+
+    if case['kind'] == 'script':
+        # the scripts build their cells and synapses at import, with no
+        # markers between the two, so only build_s is measured
+        module = 'ballandsticks1p1' if case['name'] == 'model1' else 'ballandsticks2'
+        for name in (module, 'matplotlib.pyplot'):
+            _, seconds = _timed(importlib.import_module, name)
+            row['import_s'] += seconds
+        _, row['build_s'] = _timed(importlib.import_module, case['name'])
+    elif case['kind'] == 'cells':
+        bs, seconds = _timed(importlib.import_module, case['name'])
+        row['import_s'] += seconds
+        start = time.perf_counter()
+        cells = [bs.Interneuron(0, 0, 0, 1, 0), bs.RelayCell(0, 0, 0, 1, 0)]
+        row['construct_s'] = time.perf_counter() - start
+        for cell in cells:
+            for sec in cell.all:
+                sec.nseg = case['nseg']
+        row['build_s'] = time.perf_counter() - start
+    else:
+        population, seconds = _timed(importlib.import_module, 'population')
+        row['import_s'] += seconds
+        import network
+        import profiling
+        # the circuits mark their construct and wiring phases themselves
+        with profiling.Profile(events=False) as profile:
+            pop, row['build_s'] = _timed(population.Population, case['ncircuits'],
+                                         getattr(network, case['name']))
+        row['construct_s'] = profile.phases['construct']
+        row['wiring_s'] = profile.phases['wiring']
+
+    row['nsections'] = sum(1 for _ in h.allsec())
+    row['nsegments'] = sum(sec.nseg for sec in h.allsec())
+    h.dt = case['dt']
+    _, row['init_s'] = _timed(h.finitialize, -60)
+    nsteps = int(round(case['tstop'] / case['dt']))
+    start = time.perf_counter()
+    for _ in range(nsteps):
+        h.fadvance()
+    row['steps_per_s'] = nsteps / (time.perf_counter() - start)
+    return row
+
+
+# commit the suite runs on, or None outside a git checkout
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# run every case, each in a new process, and return the results with metadata
+def run_suite(suite=None, repeat=1):
+    suite = cases() if suite is None else suite
+    rows = []
+    # spawn a new process for every case so that imports start from scratch
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        for _ in range(repeat):
+            rows += pool.map(run_case, suite, chunksize=1)
+    return {'commit': _commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'machine': platform.platform(),
+            'processor': platform.processor(), 'results': rows}
+
+
+def _case_key(row):
+    return tuple(sorted((key, value) for key, value in row.items()
+                        if key not in STAGES + ['nsections', 'nsegments']))
+
+
+# stages that got slower by more than tolerance (a fraction) between two runs
+def compare(before, after, tolerance=0.1):
+    def best(results):
+        # fastest of repeated measurements of the same case
+        table = {}
+        for row in results['results']:
+            key = _case_key(row)
+            entry = table.setdefault(key, dict(row))
+            for stage in STAGES:
+                if row[stage] is None:
+                    continue
+                pick = max if stage == 'steps_per_s' else min
+                entry[stage] = pick(entry[stage], row[stage])
+        return table
+    old, new = best(before), best(after)
+    regressions = []
+    for key, row in new.items():
+        if key not in old:
+            continue
+        for stage in STAGES:
+            a, b = old[key][stage], row[stage]
+            if a is None or b is None or a == 0 or b == 0:
+                continue
+            # steps_per_s is a rate, everything else a time
+            slowdown = a / b if stage == 'steps_per_s' else b / a
+            if slowdown > 1 + tolerance:
+                regressions.append(dict(dict(key), stage=stage, before=a, after=b,
+                                        slowdown=slowdown))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time every model variant stage by stage')
+    parser.add_argument('--out', default='benchmarks.json', help='json file for the results')
+    parser.add_argument('--quick', action='store_true', help='one nseg, dt and size only')
+    parser.add_argument('--repeat', type=int, default=1, help='times to run every case')
+    parser.add_argument('--compare', help='json results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown reported as a regression (0.1 is 10%%)')
+    args = parser.parse_args()
+
+    results = run_suite(cases(quick=args.quick), args.repeat)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('{} cases written to {}'.format(len(results['results']), args.out))
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+        regressions = compare(before, results, args.tolerance)
+        for row in regressions:
+            case = ', '.join('{}={}'.format(key, value) for key, value in row.items()
+                             if key not in ('stage', 'before', 'after', 'slowdown'))
+            print('{}: {} {:.4g} -> {:.4g} ({:.2f}x slower)'.format(
+                case, row['stage'], row['before'], row['after'], row['slowdown']))
+        print('{} regressions against {} (commit {})'.format(
+            len(regressions), args.compare, before.get('commit')))
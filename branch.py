@@ -0,0 +1,142 @@
+# =============================================================================
+# BRANCHING SWEEPS
+# -----------------------------------------------------------------------------
+# In a sweep over the input onsets of 'model3.py' (or over any other input
+# parameter of single triads) every run simulates the same circuit up to the
+# earliest onset that differs between the runs. This file simulates that
+# shared prefix once, checkpoints it with SaveState and runs every point of
+# the sweep from the checkpoint, in the same circuit with only its inputs
+# changed, e.g.
+#
+#     points = sweep.grid(onset2=[10, 12, 14], onset3=[10, 12, 14])
+#     rows = run_branches(points, base=network.MODEL3)   # as sweep.run_sweep
+#
+# The prefix ends at fork_time, so the simulated time of a sweep drops from
+# n * tstop to fork + n * (tstop - fork). Only IClamp ('iclamp') and
+# AlphaSynapse ('alpha') inputs can branch: a NetStim queues its first event
+# at finitialize, so its start cannot change after the checkpoint.
+# =============================================================================
+
+import multiprocessing
+
+from neuron import h
+from neuron.units import ms, mV
+
+import network
+import recording
+import sweep
+
+
+# table entries that have no effect on a triad before its onset
+def branch_columns(input):
+    if input not in ('iclamp', 'alpha'):
+        raise ValueError("only 'iclamp' and 'alpha' inputs can branch, not {!r}".format(input))
+    return ['onset'] + [name + '_' + field for name in network.INPUTS
+                        for field in network.INPUT_PARAMS[input]]
+
+
+# time up to which runs of the given tables (see network.make_table) are
+# the same: the earliest onset of a triad whose inputs differ between them,
+# None if they do not differ
+def fork_time(tables):
+    base = tables[0]
+    columns = branch_columns(base['input'])
+    changed = set()
+    for table in tables[1:]:
+        for key, value in table.items():
+            if value == base[key]:
+                continue
+            if key not in columns:
+                raise ValueError('{!r} changes the run before any onset, so it '
+                                 'cannot differ between branches'.format(key))
+            changed.update(k for k, (a, b) in enumerate(zip(value, base[key])) if a != b)
+    if not changed:
+        return None
+    return min(table['onset'][k] for table in tables for k in changed)
+
+
+# simulate every point (a dict as in update_params) from one checkpoint at
+# the fork time and return the traces (or spikes) of each, in order; with a
+# StateCache from 'snapshot.py' the shared prefix starts from rest
+def branches(points, base=network.MODEL3, tstop=40 * ms, dt=0.025 * ms, v_init=-60 * mV,
+             output='traces', method='fixed', atol=1e-3, atolscale=None, states=None):
+    if output not in ('traces', 'spikes'):
+        raise ValueError("output must be 'traces' or 'spikes', not {!r}".format(output))
+    ntriads = network._count_triads(base)
+    tables = [network.make_table(network.update_params(base, **point), ntriads)
+              for point in points]
+    fork = fork_time(tables)
+    fork = tstop if fork is None else min(fork, tstop)
+    circuit = network.TriadCircuit(tables[0], ntriads)
+    state = states.state(circuit) if states is not None else None
+
+    recording.set_method(method, atol, atolscale)
+    if output == 'spikes':
+        recorder = circuit.spike_recorder()
+        recorder.open(tstop, dt)
+    else:
+        probes, times, vectors = circuit.record_traces()
+        recorded = list(times.values()) + list(vectors.values())
+    h.dt = dt
+    recording.initialize(v_init, state)
+    recording.advance(fork)
+    checkpoint = h.SaveState()
+    checkpoint.save()
+    if output == 'spikes':
+        mark = recorder.mark()
+    else:
+        mark = [int(vec.size()) for vec in recorded]
+
+    results = []
+    for table in tables:
+        checkpoint.restore(0) # time, states and queued events at the fork
+        circuit.set_inputs(table)
+        if h.cvode.active():
+            h.cvode.re_init()
+        else:
+            h.fcurrent()
+        if output == 'spikes':
+            recorder.rewind(mark)
+        else:
+            for vec, n in zip(recorded, mark):
+                vec.resize(n)
+        recording.advance(tstop)
+        if output == 'spikes':
+            results.append(recorder.spikes())
+        else:
+            results.append(circuit.traces(probes, times, vectors, tstop, dt))
+    return results
+
+
+def _run_chunk(task):
+    points, kwargs = task
+    return branches(points, **kwargs)
+
+
+# run every point of a sweep by branching and return one row per point, in
+# order, as sweep.run_sweep does; with processes > 1 the points are split
+# between worker processes, each simulating the prefix once
+def run_branches(points, base=network.MODEL3, tstop=40 * ms, dt=0.025 * ms, processes=1,
+                 keep_traces=False, output='traces', states=None, interpolate=False):
+    kwargs = {'base': base, 'tstop': tstop, 'dt': dt, 'output': output, 'states': states}
+    if processes == 1:
+        results = branches(points, **kwargs)
+    else:
+        processes = processes or multiprocessing.cpu_count()
+        chunks = [points[i::processes] for i in range(processes)]
+        chunks = [chunk for chunk in chunks if chunk]
+        # spawn rather than fork so that no NEURON state is shared with the parent
+        with multiprocessing.get_context('spawn').Pool(len(chunks)) as pool:
+            parts = pool.map(_run_chunk, [(chunk, kwargs) for chunk in chunks])
+        results = [None] * len(points)
+        for i, part in enumerate(parts):
+            results[i::len(chunks)] = part
+    rows = []
+    for point, traces in zip(points, results):
+        row = dict(point)
+        row.update(sweep.summarise(traces, interpolate=interpolate) if output == 'traces'
+                   else sweep.summarise_spikes(traces))
+        if keep_traces:
+            row['traces'] = traces
+        rows.append(row)
+    return rows
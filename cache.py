@@ -0,0 +1,184 @@
+# =============================================================================
+# RESULT CACHE
+# -----------------------------------------------------------------------------
+# This file stores the traces of simulated circuits on disk, keyed by a hash
+# of everything that determines them: the full parameter table of
+# 'network.py' (defaults included), tstop, dt, the integration method, the
+# rate table settings of 'tables.py', the source of every module of the
+# model in SOURCE_MODULES and the modules of this directory they import
+# (cells, geometry, recording, ...), the source of the mechanisms/*.mod
+# files and, for input 'vecstim', the spike times of the trains.
+# Asking again for a run that is in the cache returns the stored traces
+# instead of simulating. The cache is bounded in size, dropping the least
+# recently used runs first, e.g.
+#
+#     cache = ResultCache(max_bytes=2**30)
+#     traces = cache.simulate(network.MODEL3, tstop=40)
+#     cache.invalidate(cache.key(network.MODEL3, tstop=40))
+#     cache.clear()
+# =============================================================================
+
+import functools
+import glob
+import hashlib
+import importlib
+import json
+import os
+import tempfile
+import types
+
+import numpy as np
+from neuron.units import ms
+
+import network
+import recording
+import tables
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'triadic-lgn', 'results')
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+MECHANISMS_DIR = os.path.join(SOURCE_DIR, 'mechanisms')
+
+# modules that shape the runs in the cache, with what they import from this
+# directory
+SOURCE_MODULES = ['network', 'recording', 'snapshot', 'stimuli', 'tables', 'lfp']
+
+
+# paths of SOURCE_MODULES and of every module of this directory they import,
+# directly or through each other
+def source_files():
+    found = set()
+    todo = [importlib.import_module(name) for name in SOURCE_MODULES]
+    while todo:
+        module = todo.pop()
+        path = os.path.abspath(getattr(module, '__file__', None) or '')
+        if os.path.dirname(path) != SOURCE_DIR or path in found:
+            continue
+        found.add(path)
+        todo += [value for value in vars(module).values()
+                 if isinstance(value, types.ModuleType)]
+    return sorted(found)
+
+
+# hash of the model and mechanism sources, computed once per process
+@functools.lru_cache(maxsize=None)
+def source_hash():
+    digest = hashlib.sha256()
+    paths = source_files()
+    paths += sorted(glob.glob(os.path.join(MECHANISMS_DIR, '*.mod')))
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+
+    # constructor
+    def __init__(self, path=CACHE_DIR, max_bytes=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return 'ResultCache({!r})'.format(self.path)
+
+    # key of a run: hash of its full parameter table, time step and sources,
+    # and of the spike times of its trains for input 'vecstim'
+    def key(self, params, tstop=40 * ms, dt=0.025 * ms, ntriads=None, output='traces',
+            method='fixed', atol=1e-3, atolscale=None, states=None, trains=None):
+        if ntriads is None:
+            ntriads = network._count_triads(params)
+        table = network.make_table(params, ntriads)
+        run = {'params': table, 'ntriads': ntriads, 'tstop': tstop, 'dt': dt,
+               'output': output, 'tables': tables.settings(), 'source': source_hash()}
+        if method != 'fixed':
+            # fixed step runs keep the keys they had before methods were added
+            run['method'] = method
+            run['atol'] = atol
+            run['atolscale'] = dict(recording.ATOLSCALE, **(atolscale or {}))
+        if states is not None:
+            # runs started from rest, see 'snapshot.py'
+            run['states'] = states.settings()
+        if trains is not None:
+            digest = hashlib.sha256()
+            for train in trains:
+                train = np.asarray(train, dtype=float)
+                digest.update(np.int64(len(train)).tobytes())
+                digest.update(train.tobytes())
+            run['trains'] = digest.hexdigest()
+        return hashlib.sha256(json.dumps(run, sort_keys=True, default=float).encode()).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.npz')
+
+    # stored traces of a run, or None if it is not in the cache
+    def get(self, key):
+        path = self._file(key)
+        try:
+            with np.load(path) as data:
+                traces = {name: data[name] for name in data.files}
+            os.utime(path) # mark as recently used
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        return traces
+
+    # store the traces of a run and evict old runs if the cache is too big
+    def put(self, key, traces):
+        # write to a temporary file first so other processes never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **traces)
+        os.replace(tmp, self._file(key))
+        self.evict()
+
+    # traces (or spikes) of a run, simulated only if they are not in the cache;
+    # with a StateCache from 'snapshot.py' the run starts from rest
+    def simulate(self, params, tstop=40 * ms, dt=0.025 * ms, ntriads=None, output='traces',
+                 method='fixed', atol=1e-3, atolscale=None, states=None, trains=None):
+        key = self.key(params, tstop, dt, ntriads, output, method, atol, atolscale, states,
+                       trains)
+        traces = self.get(key)
+        if traces is None:
+            run = network.simulate if states is None else states.simulate
+            traces = run(params, tstop, dt, ntriads, output, method, atol, atolscale,
+                         trains=trains)
+            self.put(key, traces)
+        return traces
+
+    # drop least recently used runs until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.path, '*.npz')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    # remove one run from the cache
+    def invalidate(self, key):
+        self._remove(self._file(key))
+
+    # remove every run from the cache
+    def clear(self):
+        for path in glob.glob(os.path.join(self.path, '*.npz')):
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # number of runs and bytes in the cache
+    def size(self):
+        sizes = [os.path.getsize(path)
+                 for path in glob.glob(os.path.join(self.path, '*.npz'))]
+        return len(sizes), sum(sizes)
@@ -0,0 +1,96 @@
+# =============================================================================
+# CELL GEOMETRY
+# -----------------------------------------------------------------------------
+# This file moves the 3D points of the cells in 'ballandsticks*.py' in bulk.
+# The points of each section are read into a numpy array once (a column
+# at a time, as NEURON only gives them point by point), the whole
+# cell is rotated about the z-axis and translated with one matrix product,
+# and the points are written back with a single pt3dadd call per section
+# instead of one pt3dchange call per point.
+# -----------------------------------------------------------------------------
+# The number of segments of a section can also be chosen by the d_lambda
+# rule: segments no longer than a fraction d_lambda of the length constant
+# at 100 Hz, e.g.
+#
+#     before, after = set_nseg(cell.all, d_lambda=0.1)
+# =============================================================================
+
+import math
+
+import numpy as np
+from neuron import h
+
+
+# the 3D points of a section as an (n, 4) array of x, y, z and diam. NEURON
+# has no call returning the points of a section at once (psection and hoc
+# loops read them one by one too), so each column is read by mapping its
+# accessor over the point indices, without a Python loop per point
+def get_points(sec):
+    n = sec.n3d()
+    points = np.empty((n, 4))
+    for j, read in enumerate((sec.x3d, sec.y3d, sec.z3d, sec.diam3d)):
+        points[:, j] = list(map(read, range(n)))
+    return points
+
+
+# replace the 3D points of a section
+def set_points(sec, points):
+    sec.pt3dclear()
+    h.pt3dadd(h.Vector(points[:, 0]), h.Vector(points[:, 1]),
+              h.Vector(points[:, 2]), h.Vector(points[:, 3]), sec=sec)
+
+
+# a copy of points rotated by theta about the z-axis, then shifted by offset
+def transformed(points, theta=0, offset=(0, 0, 0)):
+    c, s = math.cos(theta), math.sin(theta)
+    rotation = np.array([[c, -s, 0],
+                         [s, c, 0],
+                         [0, 0, 1]])
+    points = points.copy()
+    points[:, :3] = points[:, :3] @ rotation.T + offset
+    return points
+
+
+# rotate sections by theta about the z-axis, then shift them by offset
+def transform(sections, theta=0, offset=(0, 0, 0)):
+    for sec in sections:
+        points = get_points(sec)
+        if len(points) == 0:
+            continue
+        set_points(sec, transformed(points, theta, offset))
+
+
+# length constant (um) of a section at freq (Hz), from its 3D points as in
+# NEURON's fixnseg.hoc so that tapered sections are handled
+def lambda_f(sec, freq=100):
+    points = get_points(sec)
+    if len(points) < 2:
+        return 1e5 * math.sqrt(sec.diam / (4 * math.pi * freq * sec.Ra * sec.cm))
+    lengths = np.linalg.norm(np.diff(points[:, :3], axis=0), axis=1)
+    diams = points[:, 3]
+    lam = np.sum(lengths / np.sqrt(diams[:-1] + diams[1:]))
+    lam *= math.sqrt(2) * 1e-5 * math.sqrt(4 * math.pi * freq * sec.Ra * sec.cm)
+    return sec.L / lam
+
+
+# odd number of segments no longer than d_lambda length constants at freq
+def d_lambda_nseg(sec, d_lambda=0.1, freq=100):
+    return int((sec.L / (d_lambda * lambda_f(sec, freq)) + 0.9) / 2) * 2 + 1
+
+
+# set nseg of every section by the d_lambda rule, returns the number of
+# segments before and after
+def set_nseg(sections, d_lambda=0.1, freq=100):
+    before = after = 0
+    for sec in sections:
+        before += sec.nseg
+        sec.nseg = d_lambda_nseg(sec, d_lambda, freq)
+        after += sec.nseg
+    return before, after
+
+
+# name, length, length constant, current nseg and d_lambda nseg of each section
+def nseg_table(sections, d_lambda=0.1, freq=100):
+    return [{'section': sec.name(), 'L': sec.L, 'lambda': lambda_f(sec, freq),
+             'nseg': sec.nseg, 'd_lambda_nseg': d_lambda_nseg(sec, d_lambda, freq)}
+            for sec in sections]
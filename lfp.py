@@ -0,0 +1,226 @@
+# =============================================================================
+# EXTRACELLULAR POTENTIALS
+# -----------------------------------------------------------------------------
+# This file computes the extracellular potential (LFP) of populations of
+# interneurons and relay cells at a set of electrode contacts while the
+# simulation runs. The transmembrane current of every segment is recorded
+# with NEURON's fast_imem and, after every chunk of the run, multiplied by
+# a transfer matrix (contacts x nodes, line source approximation in an
+# infinite homogeneous medium), so only the contact potentials are kept and
+# streamed to disk as with 'recording.py'. The currents of synapses at the
+# ends of sections (x = 0 or 1) are included, e.g.
+#
+#     pop = population.Population(100, network.MODEL2)
+#     contacts = [(0, 0, z) for z in range(-500, 501, 50)]
+#     recorder = LFPRecorder(population_cells(pop), contacts, 'lfp.npy')
+#     pop.run(tstop=1000, recorders=[recorder])
+#     lfp = recorder.load()   # samples x contacts, in mV
+#
+# Memory holds the transfer matrix and one chunk of node currents, so it
+# grows with the number of contacts and segments but not with tstop.
+# -----------------------------------------------------------------------------
+# The transfer matrix of a cell depends only on where its nodes are and on
+# the contacts, not on the synapses, so runs of a sweep can share it. A
+# TransferCache keeps the matrix of every cell on disk, and the MEMORY_SIZE
+# most recently used ones in memory, keyed by a hash of the 3D points and
+# nseg of its sections, the contacts and sigma, e.g.
+#
+#     transfers = TransferCache()
+#     recorder = LFPRecorder(cells, contacts, 'lfp.npy', transfers=transfers)
+# -----------------------------------------------------------------------------
+# The cell classes of 'ballandsticks*.py' are plain python classes, so
+# simulating membrane dynamics does not need LFPy. LFPy, which takes seconds
+# to import, is only imported here, when a cell is wrapped for its own
+# extracellular calculations, e.g.
+#
+#     circuit = network.TriadCircuit(network.MODEL2)
+#     cell = lfpy_cell(circuit.interneuron)
+#     electrode = LFPy.RecExtElectrode(cell, x=[50], y=[0], z=[0])
+# =============================================================================
+
+import glob
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+from neuron import h
+
+import geometry
+import recording
+
+SIGMA = 0.3 # extracellular conductivity (S/m)
+TRANSFER_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'triadic-lgn', 'transfer')
+MEMORY_SIZE = 1024 # transfer matrices of cells kept in memory by each process
+
+_matrices = {} # transfer matrices of cells, by key
+
+
+# an LFPy.Cell made of the sections of one of our cells, which keeps their
+# nseg and 3D points; keyword arguments are passed on to LFPy.Cell
+def lfpy_cell(cell, **kwargs):
+    import LFPy # imported here so that only extracellular work pays for it
+    sections = h.SectionList()
+    for sec in cell.all:
+        sections.append(sec=sec)
+    start = (cell.soma.x3d(0), cell.soma.y3d(0), cell.soma.z3d(0))
+    options = {'delete_sections': False, 'nsegs_method': None, 'pt3d': True,
+               'v_init': -60}
+    options.update(kwargs)
+    lfpy = LFPy.Cell(morphology=sections, **options)
+    # LFPy.Cell moves the soma to the origin, move the cell back
+    shift = [a - b for a, b in zip(start, (cell.soma.x3d(0), cell.soma.y3d(0),
+                                           cell.soma.z3d(0)))]
+    lfpy.set_pos(*(p + d for p, d in zip(lfpy.somapos, shift)))
+    return lfpy
+
+
+# the cells of every circuit of a population (those on this rank)
+def population_cells(pop):
+    return [cell for circuit in pop.circuits
+            for cell in (circuit.interneuron, circuit.relaycell) if cell is not None]
+
+
+# positions x of the nodes of a section that carry membrane current: its
+# segments and its 1 end (and 0 end for the root section), where point
+# processes can sit; the 0 end of any other section is a node of its parent
+def current_nodes(sec):
+    xs = [seg.x for seg in sec] + [1]
+    return xs if sec.parentseg() is not None else [0] + xs
+
+
+# start and end points (n x 3 each) and diameters of the nodes of a section
+# (see current_nodes); segments are lines, the ends are points
+def node_ends(sec, points=None):
+    if points is None:
+        points = geometry.get_points(sec)
+    arc = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(points[:, :3], axis=0),
+                                                        axis=1))])
+    xs = np.array(current_nodes(sec))
+    width = np.where((xs == 0) | (xs == 1), 0, 1 / sec.nseg)
+    ends = [np.column_stack([np.interp((xs + side * width / 2) * arc[-1], arc, points[:, i])
+                             for i in range(3)]) for side in (-1, 1)]
+    diams = [seg.diam for seg in sec] + [sec(1).diam]
+    if xs[0] == 0:
+        diams.insert(0, sec(0).diam)
+    return ends[0], ends[1], np.array(diams)
+
+
+# start and end points and diameters of the nodes of all the sections
+def _nodes(sections, points=None):
+    points = points or [None] * len(sections)
+    starts, ends, diams = zip(*(node_ends(sec, p) for sec, p in zip(sections, points)))
+    return np.concatenate(starts), np.concatenate(ends), np.concatenate(diams)
+
+
+# potential (mV) at each contact of a 1 nA current out of each node, as a
+# contacts x nodes matrix; segments are line sources and section ends point
+# sources, and contacts closer than a radius are moved out to the surface
+def transfer_matrix(sections, contacts, sigma=SIGMA):
+    return _transfer(*_nodes(list(sections)), contacts, sigma)
+
+
+def _transfer(starts, ends, diams, contacts, sigma):
+    contacts = np.asarray(contacts, dtype=float).reshape(-1, 3)
+    length = np.linalg.norm(ends - starts, axis=1)
+    line = length > 0
+    axis = np.zeros_like(starts)
+    axis[line] = (ends - starts)[line] / length[line, None]
+    # position of each contact along (a) and away from (rho) each segment axis
+    offset = starts[None, :, :] - contacts[:, None, :]
+    a = np.einsum('csk,sk->cs', offset, axis)
+    rho = np.sqrt(np.maximum(np.einsum('csk,csk->cs', offset, offset) - a ** 2, 0))
+    rho = np.maximum(rho, diams / 2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lines = (np.arcsinh((a + length) / rho) - np.arcsinh(a / rho)) / length
+    return np.where(line, lines, 1 / rho) / (4 * np.pi * sigma)
+
+
+class TransferCache:
+
+    # constructor
+    def __init__(self, path=TRANSFER_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return 'TransferCache({!r})'.format(self.path)
+
+    # key of the transfer matrix of a cell: hash of the 3D points and nseg of
+    # its sections (which set where its nodes are), the contacts and sigma
+    def key(self, sections, points, contacts, sigma=SIGMA):
+        digest = hashlib.sha256()
+        for sec, array in zip(sections, points):
+            digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+            digest.update('{} {}'.format(sec.nseg, sec.parentseg() is None).encode())
+        digest.update(np.asarray(contacts, dtype=float).reshape(-1, 3).tobytes())
+        digest.update(repr(float(sigma)).encode())
+        return digest.hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.npy')
+
+    # transfer_matrix of the sections of the cells, one cached block per cell
+    def matrix(self, cells, contacts, sigma=SIGMA):
+        return np.hstack([self.cell_matrix(cell, contacts, sigma) for cell in cells])
+
+    # transfer matrix of one cell, from memory, disk or computed
+    def cell_matrix(self, cell, contacts, sigma=SIGMA):
+        sections = list(cell.all)
+        points = [geometry.get_points(sec) for sec in sections]
+        key = self.key(sections, points, contacts, sigma)
+        matrix = _matrices.pop(key, None) # reinserted below as the newest
+        if matrix is None:
+            try:
+                matrix = np.load(self._file(key))
+            except (FileNotFoundError, ValueError, OSError):
+                matrix = _transfer(*_nodes(sections, points), contacts, sigma)
+                self.put(key, matrix)
+        _matrices[key] = matrix
+        while len(_matrices) > MEMORY_SIZE:
+            del _matrices[next(iter(_matrices))] # least recently used first
+        return matrix
+
+    # write a matrix to disk
+    def put(self, key, matrix):
+        # write to a temporary file first so other processes never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp, self._file(key))
+
+    # remove every matrix from the cache (on disk and in memory)
+    def clear(self):
+        _matrices.clear()
+        for path in glob.glob(os.path.join(self.path, '*.npy')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class LFPRecorder(recording.TraceRecorder):
+
+    # constructor: the extracellular potential of the given cells at each
+    # contact (x, y, z in um), streamed to path like a TraceRecorder; with a
+    # TransferCache the transfer matrices of the cells are reused
+    def __init__(self, cells, contacts, path, sigma=SIGMA, every=1, transfers=None):
+        h.cvode.use_fast_imem(1)
+        sections = [sec for cell in cells for sec in cell.all]
+        probes = [(sec, x, 'i_membrane_') for sec in sections for x in current_nodes(sec)]
+        super().__init__(probes, path, every)
+        self.contacts = np.asarray(contacts, dtype=float).reshape(-1, 3)
+        if transfers is None:
+            self.matrix = transfer_matrix(sections, self.contacts, sigma)
+        else:
+            self.matrix = transfers.matrix(cells, self.contacts, sigma)
+        self.labels = ['contact{}({:g}, {:g}, {:g})'.format(i, *xyz)
+                       for i, xyz in enumerate(self.contacts)]
+
+    def __repr__(self):
+        return 'LFPRecorder({!r}, {} nodes, {} contacts)'.format(
+            self.path, self.matrix.shape[1], self.matrix.shape[0])
+
+    # contact potentials of a chunk of node currents (nA)
+    def _output(self, chunk):
+        return chunk @ self.matrix.T
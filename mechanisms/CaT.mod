@@ -23,14 +23,18 @@ PARAMETER {
 	cai 	= .00005 (mM)	: initial [Ca]i = 50 nM
 	cao 	= 2	(mM)	: [Ca]o = 2 mM
 	eca
+	usetable = 0 : exact rates unless tables.use_tables() switches the tables on
+	vmin = -100 (mV) : voltage range of the rate tables
+	vmax = 100 (mV)
 }
 
 
 NEURON {
+THREADSAFE
 	SUFFIX cat1h
 	USEION ca READ eca WRITE ica
         RANGE gbar, carev
-        GLOBAL ninf,linf,taul,taun, q10
+        GLOBAL ninf,linf,taul,taun, q10, vmin, vmax
 }
 
 STATE {
@@ -69,6 +73,11 @@ DERIVATIVE states {     : exact when v held constant; integrates over dt step
 
 PROCEDURE rates(v (mV)) { :callable from hoc
         LOCAL a,qt
+        : tabulated every (vmax-vmin)/400 mV, set usetable_cat1h = 1 to use them
+        TABLE ninf, linf, taun, taul
+        DEPEND celsius, q10, vhalfn, vhalfl, kn, kl, vmin, vmax
+        FROM vmin TO vmax WITH 400
+
         qt=q10^((celsius-22)/10)
         ninf = 1/(1 + exp(-(v-vhalfn)/kn))
         linf = 1/(1 + exp(-(v-vhalfl)/kl))
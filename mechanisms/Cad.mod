@@ -9,6 +9,7 @@ TITLE decay of internal calcium concentration
 INDEPENDENT {t FROM 0 TO 1 WITH 1 (ms)}
 
 NEURON {
+THREADSAFE
 	SUFFIX Cad
 	USEION Ca READ iCa, Cai WRITE Cai VALENCE 2
 	RANGE Cainf,taur,k
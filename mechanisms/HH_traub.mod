@@ -16,6 +16,7 @@ TITLE Hippocampal HH channels
 INDEPENDENT {t FROM 0 TO 1 WITH 1 (ms)}
 
 NEURON {
+THREADSAFE
 	SUFFIX hh2
 	USEION na READ ena WRITE ina
 	USEION k READ ek WRITE ik
@@ -23,6 +24,7 @@ NEURON {
 	RANGE m_inf, h_inf, n_inf
 	RANGE tau_m, tau_h, tau_n
 	RANGE m_exp, h_exp, n_exp
+	GLOBAL vmin, vmax
 :	RANGE dt
 }
 
@@ -42,6 +44,9 @@ PARAMETER {
 	v               (mV)
 	vtraubNa  = -63   (mV)
 	vtraubK   = -63   (mV)
+	usetable  = 0             : exact rates unless tables.use_tables() switches the tables on
+	vmin      = -100  (mV) : voltage range of the rate tables
+	vmax      = 100   (mV)
 }
 
 STATE {
@@ -61,7 +66,6 @@ ASSIGNED {
 	m_exp
 	h_exp
 	n_exp
-	tadj
 }
 
 
@@ -95,15 +99,24 @@ INITIAL {
 	m = 0
 	h = 0
 	n = 0
-	tadj = 3.0 ^ ((celsius-36)/ 10 )
 }
 
 
 
-PROCEDURE evaluate_fct(v(mV)) { LOCAL a,b,vNa, vK
+PROCEDURE evaluate_fct(v(mV)) {
+	na_rates(v - vtraubNa) : convert to traub convention
+	k_rates(v - vtraubK) : convert to traub convention
+}
+
+: The rates are tabulated in the traub convention, every (vmax-vmin)/400 mV
+: over the range that corresponds to v = vmin..vmax at vtraub = -63 mV.
+: Set usetable_hh2 = 1 to use them.
+
+PROCEDURE na_rates(vNa(mV)) { LOCAL a,b,tadj
+	TABLE m_inf, tau_m, h_inf, tau_h DEPEND celsius, vmin, vmax
+	FROM vmin + 63 TO vmax + 63 WITH 400
 
-	vNa = v - vtraubNa : convert to traub convention
-	vK = v - vtraubK : convert to traub convention
+	tadj = 3.0 ^ ((celsius-36)/ 10 )
 :       a = 0.32 * (13-vNa) / ( Exp((13-vNa)/4) - 1)
 	a = 0.32 * vtrap(13-vNa, 4)
 :       b = 0.28 * (vNa-40) / ( Exp((vNa-40)/5) - 1)
@@ -115,7 +128,13 @@ PROCEDURE evaluate_fct(v(mV)) { LOCAL a,b,vNa, vK
 	b = 4 / ( 1 + Exp((40-vNa)/5) )
 	tau_h = 1 / (a + b) / tadj
 	h_inf = a / (a + b)
+}
 
+PROCEDURE k_rates(vK(mV)) { LOCAL a,b,tadj
+	TABLE n_inf, tau_n DEPEND celsius, vmin, vmax
+	FROM vmin + 63 TO vmax + 63 WITH 400
+
+	tadj = 3.0 ^ ((celsius-36)/ 10 )
 :       a = 0.032 * (15-vK) / ( Exp((15-vK)/5) - 1)
 	a = 0.032 * vtrap(15-vK, 5)
 	b = 0.5 * Exp((10-vK)/40)
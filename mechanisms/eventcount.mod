@@ -0,0 +1,23 @@
+TITLE counter of delivered events
+:
+: Artificial cell that counts the events it receives since finitialize.
+: 'profiling.py' connects one to the source of every NetCon it watches, with
+: the same delay, to count the events that NetCon delivers.
+
+NEURON {
+THREADSAFE
+	ARTIFICIAL_CELL EventCounter
+	RANGE count
+}
+
+ASSIGNED {
+	count
+}
+
+INITIAL {
+	count = 0
+}
+
+NET_RECEIVE (w) {
+	count = count + 1
+}
@@ -14,7 +14,7 @@ THREADSAFE
 	SUFFIX iar
 	USEION other WRITE iother VALENCE 1
         RANGE ghbar,  iother
-	GLOBAL h_inf, tauh, erev, stp,  shift
+	GLOBAL h_inf, tauh, erev, stp,  shift, vmin, vmax
 }
 
 
@@ -42,6 +42,9 @@ PARAMETER {
 	a2 = 30.7
 	a3 = 78.8
 	a4 = 5.78
+	usetable = 0 : exact rates unless tables.use_tables() switches the tables on
+	vmin = -100 (mV) : voltage range of the rate tables
+	vmax = 100 (mV)
 }
 
 
@@ -77,6 +80,10 @@ INITIAL {
 
 
 PROCEDURE evaluate_fct(v (mV)) {
+	: tabulated every (vmax-vmin)/400 mV, set usetable_iar = 1 to use them
+	TABLE h_inf, tauh DEPEND shift, stp, a0, a1, a2, a3, a4, vmin, vmax
+	FROM vmin TO vmax WITH 400
+
 	h_inf = 1 / ( 1 + exp((v+shift+a0)/stp) )
 	tauh = exp((v+shift+a1)/a2) / ( 1 + exp((v+shift+a3)/a4))
 }
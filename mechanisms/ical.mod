@@ -21,7 +21,7 @@ THREADSAFE
 	SUFFIX ical
 	USEION Ca READ Cai, Cao WRITE iCa VALENCE 2
       RANGE pcabar, g
-	GLOBAL 	m_inf, taum, sh1, sh2
+	GLOBAL 	m_inf, taum, sh1, sh2, vmin, vmax
 }
 
 
@@ -44,6 +44,9 @@ PARAMETER {
 	pcabar	= 9e-4	(mho/cm2)
 	sh1 	= -17		 : Modified (-10 in Zhu et al. 99a)
 	sh2	= -7		 : Modified (0 in Zhu et al. 99a)
+	usetable	= 0		: exact rates unless tables.use_tables() switches the tables on
+	vmin	= -100	(mV)	: voltage range of the rate tables
+	vmax	= 100	(mV)
 }
 
 
@@ -52,7 +55,6 @@ STATE {
 }
 
 INITIAL {
-	tadj = 3 ^ ((celsius-21.0)/10)
 	evaluate_fct(v)
 	m = m_inf
 }
@@ -63,7 +65,6 @@ ASSIGNED {
 	g       (mho/cm2)
 	m_inf
 	taum	(ms)
-      tadj
 }
 
 BREAKPOINT { 
@@ -79,13 +80,16 @@ DERIVATIVE states {
 
 
 UNITSOFF
-PROCEDURE evaluate_fct(v(mV)) {  LOCAL a,b
+PROCEDURE evaluate_fct(v(mV)) {  LOCAL a,b,q
 :  activation kinetics of Kay-Wong were at 20-22 deg. C
 :  transformation to 36 deg assuming Q10=3
+	: tabulated every (vmax-vmin)/400 mV, set usetable_ical = 1 to use them
+	TABLE m_inf, taum DEPEND celsius, sh1, sh2, vmin, vmax FROM vmin TO vmax WITH 400
 
+	q = 3 ^ ((celsius-21.0)/10)
 	a = 1.6 / (1 + exp(-0.072*(v+sh1+5)) )
 	b = 0.02 * (v+sh2-1.31) / ( exp((v+sh2-1.31)/5.36) - 1)
-	taum = 1.0 / (a + b) / tadj
+	taum = 1.0 / (a + b) / q
 	m_inf = a / (a + b)
 }
 
@@ -18,6 +18,7 @@ THREADSAFE
 	USEION Ca READ Cai, Cao WRITE iCa VALENCE 2
 	RANGE gcabar, g
 	GLOBAL m_inf, tau_m, h_inf, tau_h, shift2, sm, sh, phi_m, phi_h, hx, mx, shift1
+	GLOBAL vmin, vmax
 }
 
 UNITS {
@@ -56,6 +57,9 @@ PARAMETER {
       sh = 6.4
 	shift1 = -8 	(mV) : Halnes et al. 2011
       shift2  = 0    	(mV) : Halnes et al. 2011
+	usetable = 0 : exact rates unless tables.use_tables() switches the tables on
+	vmin = -100	(mV) : voltage range of the rate tables
+	vmax = 100	(mV)
 }
 
 
@@ -102,11 +106,20 @@ INITIAL {
 	h = h_inf
 }
 
-PROCEDURE evaluate_fct(v(mV)) { 
+PROCEDURE evaluate_fct(v(mV)) { LOCAL qm, qh
+	: tabulated every (vmax-vmin)/400 mV, set usetable_it2 = 1 to use them
+	TABLE m_inf, tau_m, h_inf, tau_h
+	DEPEND celsius, mx, hx, shift1, shift2, sm, sh, minf1, hinf1,
+	       taum1, taum2, taum3, taum4, taum5, tauh1, tauh2, tauh3, tauh4, tauh5, vmin, vmax
+	FROM vmin TO vmax WITH 400
+
+	: phi_m and phi_h, computed here so that they are part of the table
+	qm = mx ^ ((celsius-23.5)/10)
+	qh = hx ^ ((celsius-23.5)/10)
 	m_inf = 1.0 / ( 1 + exp(-(v+shift1+minf1)/sm) )
 	h_inf = 1.0 / ( 1 + exp((v+shift2+hinf1)/sh) )
-	tau_m = (taum1+1.0/(exp((v+shift1+taum2)/(taum3))+exp((v+shift1+taum4)/taum5)))/ phi_m
-	tau_h = (tauh1+1/(exp((v+shift2+tauh2)/tauh3)+exp(-(v+shift2+tauh4)/tauh5)))/phi_h
+	tau_m = (taum1+1.0/(exp((v+shift1+taum2)/(taum3))+exp((v+shift1+taum4)/taum5)))/ qm
+	tau_h = (tauh1+1/(exp((v+shift2+tauh2)/tauh3)+exp(-(v+shift2+tauh4)/tauh5)))/qh
 }
 
 FUNCTION ghk(v(mV), Ci(mM), Co(mM)) (.001 coul/cm3) {
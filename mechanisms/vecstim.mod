@@ -0,0 +1,95 @@
+TITLE stream of events from a Vector of times
+:
+: Artificial cell that fires at the times held in a Vector, e.g.
+:
+:     stim = h.VecStim()
+:     stim.play(h.Vector([5, 12, 30]))
+:
+: The times must be in increasing order. The Vector is read at every
+: finitialize, so its contents can be changed between runs. After the
+: VecStim of NEURON's netcon examples (share/examples/nrniv/netcon/vecevent.mod).
+
+NEURON {
+THREADSAFE
+	ARTIFICIAL_CELL VecStim
+	BBCOREPOINTER ptr
+}
+
+ASSIGNED {
+	index
+	etime (ms)
+	ptr
+}
+
+INITIAL {
+	index = 0
+	element()
+	if (index > 0) {
+		net_send(etime - t, 1)
+	}
+}
+
+NET_RECEIVE (w) {
+	if (flag == 1) {
+		net_event(t)
+		element()
+		if (index > 0) {
+			net_send(etime - t, 1)
+		}
+	}
+}
+
+DESTRUCTOR {
+VERBATIM
+	void* vv = (void*)(_p_ptr);
+	if (vv) {
+		hoc_obj_unref(*vector_pobj((IvocVect*)vv));
+	}
+ENDVERBATIM
+}
+
+: next event time from the Vector, index = -1 once it is used up
+PROCEDURE element() {
+VERBATIM
+	{ void* vv; int i, size; double* px;
+	i = (int)index;
+	if (i >= 0) {
+		vv = (void*)(_p_ptr);
+		if (vv) {
+			size = vector_capacity((IvocVect*)vv);
+			px = vector_vec((IvocVect*)vv);
+			if (i < size) {
+				etime = px[i];
+				index += 1.;
+			}else{
+				index = -1.;
+			}
+		}else{
+			index = -1.;
+		}
+	}
+	}
+ENDVERBATIM
+}
+
+: play(vec) streams the times in vec, play() with no argument stops
+PROCEDURE play() {
+VERBATIM
+	void** pv;
+	void* ptmp = NULL;
+	if (ifarg(1)) {
+		ptmp = vector_arg(1);
+		hoc_obj_ref(*vector_pobj((IvocVect*)ptmp));
+	}
+	pv = (void**)(&_p_ptr);
+	if (*pv) {
+		hoc_obj_unref(*vector_pobj((IvocVect*)*pv));
+	}
+	*pv = ptmp;
+ENDVERBATIM
+}
+
+VERBATIM
+static void bbcore_write(double* x, int* d, int* xx, int *offset, _threadargsproto_){}
+static void bbcore_read(double* x, int* d, int* xx, int* offset, _threadargsproto_){}
+ENDVERBATIM
@@ -0,0 +1,620 @@
+# =============================================================================
+# TRIAD NETWORK BUILDER
+# -----------------------------------------------------------------------------
+# This file builds an interneuron and a relay cell from 'ballandsticks2.py'
+# with any number of triads. Each triad has its own interneuron dendrite, an
+# RGC input to the relay cell and to the proximal and distal parts of that
+# dendrite, and a dendrodendritic inhibitory synapse from the distal dendrite
+# onto the relay cell. The interneuron also inhibits the relay cell through
+# the axosomatic synapse.
+# -----------------------------------------------------------------------------
+# Synapse parameters are given as a table: a dict with one entry per
+# parameter, holding either a single value shared by all triads or a list
+# with one value per triad. The circuits of 'model2.py', 'model3.py' and
+# 'model4.py' are the tables MODEL2, MODEL3 and MODEL4 below, e.g.
+#
+#     circuit = TriadCircuit(MODEL3)
+#     circuit = TriadCircuit(MODEL2, ntriads=100)
+#     circuit = TriadCircuit(dict(MODEL4, onset=[5, 6, 7]))
+#
+# Single triads can be changed by numbering a parameter from 1, so
+# update_params(MODEL3, onset2=7) only moves the second onset. The table
+# entry d_lambda chooses nseg of every section by the d_lambda rule (see
+# 'geometry.py') instead of the fixed nseg = 11. Runs can use
+# variable time steps, see 'recording.py', e.g.
+#
+#     traces = simulate(MODEL3, tstop=1000, method='cvode', atol=1e-4)
+#
+# The table entry reduced swaps the interneuron for the ReducedInterneuron
+# of 'ballandsticks2.py' (True, or a dict of its settings), which is much
+# cheaper to simulate, see 'reduction.py' for how closely it follows.
+#
+# As in the published model3.py, the distal part of the last dendrite hangs
+# from the end of the proximal part of the one before it (dend3_d on
+# dend2_p), and the presets reproduce the published runs. The table entry
+# corrected_wiring=True attaches it to its own proximal part instead.
+#
+# With input 'vecstim' each triad is driven by a spike train (see
+# 'stimuli.py') instead of the regular train of a NetStim, e.g.
+#
+#     circuit = TriadCircuit(dict(MODEL2, input='vecstim'), trains=trains)
+#     traces = simulate(dict(MODEL2, input='vecstim'), trains=trains)
+#
+# A 'vecstim' table without trains is an error rather than a circuit whose
+# VecStims play empty vectors and which runs without input.
+#
+# A built circuit takes new parameters in place, so many runs of one
+# circuit pay for building it once: weights, delays, kinetics, reversal
+# potentials, onsets and IClamp or AlphaSynapse settings can change, the
+# kind of input, the cells and the synapse positions (STRUCTURE_PARAMS)
+# cannot, e.g.
+#
+#     circuit = TriadCircuit(MODEL2)
+#     circuit.update(rc_exc_weight=np.array([1, 3, 5]), in_exc_tau2=4)
+#     circuit.set_params(dict(MODEL2, triad_inh_weight=5))
+#     traces = circuit.run()   # or circuit.reset() before advancing by hand
+#
+# simulate(..., reuse=True) keeps the last circuit it built and sets the
+# parameters of the next table in it when they allow. That circuit stays
+# built after the call: call release() before building other circuits.
+# The resting states of 'snapshot.py' hold the whole model, so StateCache
+# releases it unless it is the circuit whose state is wanted, and
+# StateCache.simulate(..., reuse=True) starts runs of the kept circuit.
+# =============================================================================
+
+import numbers
+import re
+
+import ballandsticks2 as bs2
+import numpy as np
+from neuron import h
+from neuron.units import ms, mV
+
+import profiling
+import recording
+
+h.load_file('stdrun.hoc')
+
+# input synapses of each triad and the section they sit on
+INPUTS = ['rc_exc', 'in_exc', 'triad_exc']
+
+# parameters of one input synapse for each kind of input
+INPUT_PARAMS = {
+    'netstim': ['weight', 'delay', 'e', 'tau1', 'tau2'],  # Exp2Syn + NetStim
+    'iclamp': ['amp', 'dur'],                             # IClamp
+    'alpha': ['gmax', 'tau', 'e'],                        # AlphaSynapse
+    'vecstim': ['weight', 'delay', 'e', 'tau1', 'tau2'],  # Exp2Syn + VecStim
+}
+
+# inputs driven by an artificial cell through Exp2Syn synapses
+SYNAPTIC_INPUTS = ['netstim', 'vecstim']
+
+# parameters shared by the whole circuit rather than set per triad
+CIRCUIT_PARAMS = ['input', 'd_lambda', 'reduced', 'corrected_wiring', 'rc_inh_pos', 'rc_inh_weight',
+                  'rc_inh_delay', 'rc_inh_e', 'rc_inh_tau1', 'rc_inh_tau2']
+
+# parameters fixed once a circuit is built: the kind of input, the cells and
+# where the synapses and the sources of the triadic inhibition sit
+STRUCTURE_PARAMS = ['input', 'd_lambda', 'reduced', 'corrected_wiring', 'rc_inh_pos', 'triad_inh_src',
+                    'rc_exc_pos', 'in_exc_pos', 'triad_exc_pos', 'triad_inh_pos']
+
+# values used for any parameter a table leaves out
+DEFAULTS = {
+    'onset': 5 * ms,
+    'stim_number': 1,
+    'stim_interval': 0.5 * ms,
+    'in_exc_pos': 0.1,
+    'triad_exc_pos': 1,
+    'triad_inh_src': 0.99,
+    'triad_inh_weight': 10,
+    'triad_inh_delay': 0.5 * ms,
+    'triad_inh_e': -75 * mV,
+    'triad_inh_tau1': 0.1 * ms, # tau1 is never set in the model scripts
+    'triad_inh_tau2': 4.2 * ms,
+    'rc_inh_pos': 0.1,
+    'rc_inh_weight': 10,
+    'rc_inh_delay': 1 * ms,
+    'rc_inh_e': -75 * mV,
+    'rc_inh_tau1': 0.7 * ms,
+    'rc_inh_tau2': 4.2 * ms,
+    'd_lambda': None, # nseg = 11 everywhere, or nseg by the d_lambda rule
+    'reduced': None, # the full interneuron, or True or settings of the reduced one
+    'corrected_wiring': False, # the last distal dendrite on its own proximal one
+}
+
+# model2.py: NetStim driven Exp2Syn inputs
+MODEL2 = {
+    'input': 'netstim',
+    'onset': 5 * ms,
+    'rc_exc_pos': [0.28, 0.58, 0.88],
+    'rc_exc_weight': 5,
+    'rc_exc_delay': 0 * ms,
+    'rc_exc_e': 42 * mV,
+    'rc_exc_tau1': 1 * ms,
+    'rc_exc_tau2': 2 * ms,
+    'in_exc_weight': 0.6,
+    'in_exc_delay': 0 * ms,
+    'in_exc_e': 42 * mV,
+    'in_exc_tau1': 1.6 * ms,
+    'in_exc_tau2': 3.6 * ms,
+    'triad_exc_weight': 2,
+    'triad_exc_delay': 0 * ms,
+    'triad_exc_e': 42 * mV,
+    'triad_exc_tau1': 1 * ms,
+    'triad_exc_tau2': 2 * ms,
+    'triad_inh_pos': [0.3, 0.6, 0.9],
+    'triad_inh_weight': 10,
+    'rc_inh_weight': 10,
+}
+
+# model3.py: IClamp inputs with staggered onsets
+MODEL3 = {
+    'input': 'iclamp',
+    'onset': [5 * ms, 6.6 * ms, 8.2 * ms],
+    'rc_exc_pos': [0.28, 0.58, 0.98],
+    'rc_exc_amp': 5,
+    'rc_exc_dur': 0.5 * ms,
+    'in_exc_amp': 1,
+    'in_exc_dur': 0.5 * ms,
+    'triad_exc_amp': 5,
+    'triad_exc_dur': 0.5 * ms,
+    'triad_inh_pos': [0.3, 0.6, 0.9],
+    'triad_inh_weight': 1.5,
+    'rc_inh_weight': 1.5,
+}
+
+# model4.py: AlphaSynapse inputs of increasing strength
+MODEL4 = {
+    'input': 'alpha',
+    'onset': 5 * ms,
+    'rc_exc_pos': [0.28, 0.58, 0.98],
+    'rc_exc_gmax': [5, 10, 15],
+    'rc_exc_tau': 0.2 * ms,
+    'rc_exc_e': 0 * mV,
+    'in_exc_gmax': [5, 10, 15],
+    'in_exc_tau': 0.2 * ms,
+    'in_exc_e': 0 * mV,
+    'triad_exc_gmax': [5, 10, 15],
+    'triad_exc_tau': [0.5 * ms, 0.2 * ms, 0.2 * ms],
+    'triad_exc_e': 0 * mV,
+    'triad_inh_pos': [0.3, 0.6, 0.9],
+    'triad_inh_weight': 1.5,
+    'rc_inh_weight': 1.5,
+}
+
+
+class TriadCircuit:
+
+    # constructor; with a ParallelContext pc the two cells are dealt to MPI
+    # ranks round-robin, only the local ones are built and the inhibitory
+    # connections are made through gids (see source_gids); trains holds the
+    # spike train of each triad for input 'vecstim'
+    def __init__(self, params, ntriads=None, gid=0, x=0, y=0, z=1, theta=0, pc=None,
+                 trains=None):
+        self.input = params.get('input', 'netstim')
+        if self.input not in INPUT_PARAMS:
+            raise ValueError('unknown input type {!r}, expected one of {}'.format(
+                self.input, sorted(INPUT_PARAMS)))
+        _check_trains(self.input, trains)
+        self.ntriads = ntriads if ntriads is not None else _count_triads(params)
+        self.params = make_table(params, self.ntriads)
+        self._gid = gid
+        self._pc = pc
+        self._spike_recorder = None
+        self.interneuron = self.relaycell = None
+        reduced = self.params['reduced']
+        wiring = self.params['corrected_wiring']
+        if reduced and self.params['d_lambda'] is not None:
+            raise ValueError('the reduced interneuron sets its own nseg, so it '
+                             'cannot be used with d_lambda')
+        with profiling.phase('construct'):
+            if self.is_local('interneuron') and reduced:
+                settings = {} if reduced is True else reduced
+                self.interneuron = bs2.ReducedInterneuron(
+                    gid, x, y, z, theta, ndend=self.ntriads,
+                    corrected_wiring=wiring, **settings)
+            elif self.is_local('interneuron'):
+                self.interneuron = bs2.Interneuron(gid, x, y, z, theta, ndend=self.ntriads,
+                                                   d_lambda=self.params['d_lambda'],
+                                                   corrected_wiring=wiring)
+            if self.is_local('relaycell'):
+                self.relaycell = bs2.RelayCell(gid, x, y, z, theta,
+                                               d_lambda=self.params['d_lambda'])
+
+        # vectors to store synapses, connections and stimulators
+        self.syns = []
+        self.netcons = []
+        self.stims = []
+        self.train_vectors = []
+        with profiling.phase('wiring'):
+            self._setup_sources()
+            self._setup_inputs()
+            if trains is not None:
+                self.set_trains(trains)
+            self._setup_triadic_inhibition()
+            self._setup_axosomatic_inhibition()
+            self.set_inhibition(self.params)
+        profiling.watch({'rgc_input': [con for name in INPUTS
+                                       for con in getattr(self, name + '_con')],
+                         'triad_inh': self.triad_inh_con, 'rc_inh': [self.rc_inh_con]})
+
+    # specify how the circuit is to be displayed
+    def __repr__(self):
+        return 'TriadCircuit[{}]({} triads, {})'.format(
+            self._gid, self.ntriads, self.input)
+
+    # MPI rank owning the interneuron or relay cell, dealt round-robin by cell
+    def rank(self, cell):
+        if self._pc is None:
+            return 0
+        index = 2 * self._gid + (cell == 'relaycell')
+        return index % int(self._pc.nhost())
+
+    def is_local(self, cell):
+        return self._pc is None or self.rank(cell) == int(self._pc.id())
+
+    # gids of the interneuron's inhibitory outputs: the axon tip and each
+    # distal dendrite (used only when the circuit is distributed)
+    def source_gids(self):
+        base = self._gid * (self.ntriads + 1)
+        return base, [base + 1 + k for k in range(self.ntriads)]
+
+    # register the interneuron's outputs with the ParallelContext
+    def _setup_sources(self):
+        if self._pc is None or self.interneuron is None:
+            return
+        p = self.params
+        axon_gid, dend_gids = self.source_gids()
+        sources = [(axon_gid, self.interneuron.axon_d, 1)]
+        sources += [(gid, dend_d, p['triad_inh_src'][k]) for k, (gid, dend_d)
+                    in enumerate(zip(dend_gids, self.interneuron.dend_d))]
+        self._source_netcons = []
+        for gid, sec, x in sources:
+            self._pc.set_gid2node(gid, self._pc.id())
+            netcon = h.NetCon(sec(x)._ref_v, None, sec=sec)
+            self._pc.cell(gid, netcon)
+            self._source_netcons.append(netcon)
+
+    # connection from an interneuron output to a synapse on the relay cell
+    def _connect(self, gid, sec, x, syn):
+        if self._pc is None:
+            return h.NetCon(sec(x)._ref_v, syn, sec=sec)
+        return self._pc.gid_connect(gid, syn)
+
+    # target segment of each input synapse of triad k, None if its cell is not local
+    def _input_segment(self, name, k):
+        pos = self.params[name + '_pos'][k]
+        if name == 'rc_exc':
+            return self.relaycell.soma(pos) if self.relaycell else None
+        if self.interneuron is None:
+            return None
+        if name == 'in_exc':
+            return self.interneuron.dend_p[k](pos)
+        return self.interneuron.dend_d[k](pos)
+
+    # RGC inputs: excitation of the relay cell and of both parts of each dendrite
+    def _setup_inputs(self):
+        for name in INPUTS:
+            setattr(self, name, [])
+            setattr(self, name + '_con', [])
+        for k in range(self.ntriads):
+            if self.input == 'netstim':
+                stim = h.NetStim()
+                self.stims.append(stim)
+            elif self.input == 'vecstim':
+                stim = h.VecStim()
+                vector = h.Vector()
+                stim.play(vector)
+                self.stims.append(stim)
+                self.train_vectors.append(vector)
+            for name in INPUTS:
+                seg = self._input_segment(name, k)
+                syn = con = None
+                if seg is None:
+                    pass
+                elif self.input in SYNAPTIC_INPUTS:
+                    syn = h.Exp2Syn(seg)
+                    con = h.NetCon(stim, syn)
+                    self.netcons.append(con)
+                elif self.input == 'iclamp':
+                    syn = h.IClamp(seg)
+                else:
+                    syn = h.AlphaSynapse(seg)
+                if self.input in SYNAPTIC_INPUTS:
+                    getattr(self, name + '_con').append(con)
+                getattr(self, name).append(syn)
+                if syn is not None:
+                    self.syns.append(syn)
+        self.set_inputs(self.params)
+
+    # set the onsets and synapse parameters of the inputs from a table made by
+    # make_table, in place; NetStim starts take effect at the next finitialize
+    def set_inputs(self, table):
+        for k in range(self.ntriads):
+            if self.input == 'netstim':
+                stim = self.stims[k]
+                stim.number = table['stim_number'][k]
+                stim.start = table['onset'][k]
+                stim.interval = table['stim_interval'][k]
+            for name in INPUTS:
+                syn = getattr(self, name)[k]
+                if syn is None:
+                    continue
+                if self.input in SYNAPTIC_INPUTS:
+                    syn.e = table[name + '_e'][k]
+                    syn.tau1 = table[name + '_tau1'][k]
+                    syn.tau2 = table[name + '_tau2'][k]
+                    con = getattr(self, name + '_con')[k]
+                    con.weight[0] = table[name + '_weight'][k]
+                    con.delay = table[name + '_delay'][k]
+                elif self.input == 'iclamp':
+                    syn.delay = table['onset'][k]
+                    syn.dur = table[name + '_dur'][k]
+                    syn.amp = table[name + '_amp'][k]
+                else:
+                    syn.onset = table['onset'][k]
+                    syn.tau = table[name + '_tau'][k]
+                    syn.gmax = table[name + '_gmax'][k]
+                    syn.e = table[name + '_e'][k]
+        self.params = table
+
+    # spike times (ms) of the RGC input of each triad for input 'vecstim',
+    # copied into the played vectors in place; they take effect at the next
+    # finitialize
+    def set_trains(self, trains):
+        if self.input != 'vecstim':
+            raise ValueError("trains need input 'vecstim', not {!r}".format(self.input))
+        if len(trains) != self.ntriads:
+            raise ValueError('{} trains given for {} triads'.format(len(trains), self.ntriads))
+        for vector, train in zip(self.train_vectors, trains):
+            vector.from_python(np.asarray(train, dtype=float))
+
+    # inhibitory dendrodendritic synapses from each distal dendrite onto the relay cell
+    def _setup_triadic_inhibition(self):
+        p = self.params
+        self.triad_inh = []
+        self.triad_inh_con = []
+        _, gids = self.source_gids()
+        for k in range(self.ntriads):
+            if self.relaycell is None:
+                self.triad_inh.append(None)
+                self.triad_inh_con.append(None)
+                continue
+            dend_d = self.interneuron.dend_d[k] if self.interneuron else None
+            syn = h.Exp2Syn(self.relaycell.soma(p['triad_inh_pos'][k]))
+            con = self._connect(gids[k], dend_d, p['triad_inh_src'][k], syn)
+            self.triad_inh.append(syn)
+            self.triad_inh_con.append(con)
+            self.syns.append(syn)
+            self.netcons.append(con)
+
+    # inhibitory axosomatic synapse between interneuron and relay cell
+    def _setup_axosomatic_inhibition(self):
+        p = self.params
+        self.rc_inh = self.rc_inh_con = None
+        if self.relaycell is None:
+            return
+        axon_d = self.interneuron.axon_d if self.interneuron else None
+        gid, _ = self.source_gids()
+        self.rc_inh = h.Exp2Syn(self.relaycell.soma(p['rc_inh_pos']))
+        self.rc_inh_con = self._connect(gid, axon_d, 1, self.rc_inh)
+        self.syns.append(self.rc_inh)
+        self.netcons.append(self.rc_inh_con)
+
+    # set the weights, delays and kinetics of the inhibitory synapses from a
+    # table made by make_table, in place
+    def set_inhibition(self, table):
+        for k, (syn, con) in enumerate(zip(self.triad_inh, self.triad_inh_con)):
+            if syn is None:
+                continue
+            con.weight[0] = table['triad_inh_weight'][k]
+            con.delay = table['triad_inh_delay'][k]
+            syn.e = table['triad_inh_e'][k]
+            syn.tau1 = table['triad_inh_tau1'][k]
+            syn.tau2 = table['triad_inh_tau2'][k]
+        if self.rc_inh is not None:
+            self.rc_inh_con.weight[0] = table['rc_inh_weight']
+            self.rc_inh_con.delay = table['rc_inh_delay']
+            self.rc_inh.e = table['rc_inh_e']
+            self.rc_inh.tau1 = table['rc_inh_tau1']
+            self.rc_inh.tau2 = table['rc_inh_tau2']
+        self.params = table
+
+    # the entries of STRUCTURE_PARAMS in which a table (as for the
+    # constructor) differs from the circuit
+    def structure_changes(self, params):
+        table = make_table(params, self.ntriads)
+        return [name for name in STRUCTURE_PARAMS if table[name] != self.params[name]]
+
+    # set every parameter of the circuit to those of a table (as for the
+    # constructor, per-triad entries may be numpy arrays) without building
+    # anything again; they take effect at the next finitialize (see reset)
+    def set_params(self, params):
+        changed = self.structure_changes(params)
+        if changed:
+            raise ValueError('{} cannot change in a built circuit'.format(', '.join(changed)))
+        table = make_table(params, self.ntriads)
+        self.set_inputs(table)
+        self.set_inhibition(table)
+
+    # change some parameters in place, named as in update_params (onset2,
+    # rc_exc_weight=array of one weight per triad, ...)
+    def update(self, **values):
+        self.set_params(update_params(self.params, **values))
+
+    # initialise a new run after changing parameters, as run does: every
+    # state to v_init (or the state of 'snapshot.py') and the inputs queued
+    # again; this initialises every circuit of the NEURON instance
+    def reset(self, v_init=-60 * mV, state=None):
+        recording.initialize(v_init, state)
+
+    # where spikes are detected in spike output mode (local cells only)
+    def spike_sources(self):
+        sources = {}
+        if self.relaycell is not None:
+            sources['rc_soma'] = (self.relaycell.soma, 0.5)
+        if self.interneuron is not None:
+            sources['in_soma'] = (self.interneuron.soma, 0.5)
+            sources['in_axon_d'] = (self.interneuron.axon_d, 1)
+        return sources
+
+    # SpikeRecorder of the spike sources, made once and reused by every run
+    def spike_recorder(self):
+        if self._spike_recorder is None:
+            self._spike_recorder = recording.SpikeRecorder(self.spike_sources())
+        return self._spike_recorder
+
+    # simulate the circuit and return the relay cell and interneuron voltage,
+    # or with output='spikes' only the spike times at the spike sources; with
+    # a state from 'snapshot.py' the cells start at rest instead of at v_init
+    def run(self, tstop=40 * ms, dt=0.025 * ms, v_init=-60 * mV, output='traces',
+            method='fixed', atol=1e-3, atolscale=None, state=None):
+        if output == 'spikes':
+            recorder = self.spike_recorder()
+            recording.run([recorder], tstop, dt, v_init, chunk=tstop,
+                          method=method, atol=atol, atolscale=atolscale, state=state)
+            return recorder.spikes()
+        if output != 'traces':
+            raise ValueError("output must be 'traces' or 'spikes', not {!r}".format(output))
+        recording.set_method(method, atol, atolscale)
+        probes, times, vectors = self.record_traces()
+        h.dt = dt
+        recording.initialize(v_init, state)
+        recording.advance(tstop)
+        return self.traces(probes, times, vectors, tstop, dt)
+
+    # vectors recording the time and voltage at the probes of a traces run,
+    # started before initialising
+    def record_traces(self):
+        probes = {'v_rc': self.relaycell.soma(0.5),
+                  'v_in': self.interneuron.soma(0.5),
+                  'v_axon': self.interneuron.axon_d(1)}
+        # with variable steps each cell has its own time under lvardt
+        times = {name: h.Vector().record(h._ref_t, sec=seg.sec) for name, seg in probes.items()}
+        vectors = {name: h.Vector().record(seg._ref_v, sec=seg.sec)
+                   for name, seg in probes.items()}
+        return probes, times, vectors
+
+    # traces of a run from the vectors of record_traces
+    def traces(self, probes, times, vectors, tstop, dt):
+        if not h.cvode.active():
+            traces = {'t': np.array(times['v_rc'])}
+            traces.update((name, np.array(vec)) for name, vec in vectors.items())
+            return traces
+        # interpolate the variable steps onto samples every dt
+        traces = {'t': dt * np.arange(int(round(tstop / dt)) + 1)}
+        for name, seg in probes.items():
+            t = np.append(np.array(times[name]), h.t)
+            v = np.append(np.array(vectors[name]), seg.v)
+            traces[name] = np.interp(traces['t'], t, v)
+        return traces
+
+
+# build a circuit from a table, simulate it and return its traces or spikes;
+# with reuse=True the circuit of the last such call is set to the table
+# instead, when only parameters outside STRUCTURE_PARAMS differ; trains
+# holds the spike train of each triad for input 'vecstim'
+def simulate(params, tstop=40 * ms, dt=0.025 * ms, ntriads=None, output='traces',
+             method='fixed', atol=1e-3, atolscale=None, reuse=False, trains=None):
+    if reuse:
+        circuit = reusable_circuit(params, ntriads, trains)
+    else:
+        circuit = TriadCircuit(params, ntriads=ntriads, trains=trains)
+    return circuit.run(tstop, dt, output=output, method=method, atol=atol,
+                       atolscale=atolscale)
+
+
+_reusable = None # circuit kept by reusable_circuit
+
+
+# the circuit of the last call set to the table (and trains) in place, or a
+# new circuit replacing it when the number of triads or the structure differ
+def reusable_circuit(params, ntriads=None, trains=None):
+    global _reusable
+    _check_trains(params.get('input', 'netstim'), trains)
+    ntriads = ntriads if ntriads is not None else _count_triads(params)
+    circuit = _reusable
+    if circuit is not None and circuit.ntriads == ntriads and not circuit.structure_changes(params):
+        circuit.set_params(params)
+        if trains is not None:
+            circuit.set_trains(trains)
+        return circuit
+    _reusable = circuit = None # the old cells go before the new ones are built
+    _reusable = TriadCircuit(params, ntriads=ntriads, trains=trains)
+    return _reusable
+
+
+# drop the circuit kept by reusable_circuit, e.g. before building others
+def release():
+    global _reusable
+    _reusable = None
+
+
+# a 'vecstim' circuit without trains would run without input
+def _check_trains(input, trains):
+    if input == 'vecstim' and trains is None:
+        raise ValueError("input 'vecstim' needs trains, one spike train per triad")
+
+
+# number of triads implied by the longest per-triad column of a table
+def _count_triads(params):
+    lengths = [len(value) for key, value in params.items()
+               if key not in CIRCUIT_PARAMS and not _is_scalar(value)]
+    return max(lengths) if lengths else 1
+
+
+def _is_scalar(value):
+    return isinstance(value, (numbers.Number, str))
+
+
+# names of the parameters set per triad for a type of input
+def triad_columns(input):
+    columns = ['onset', 'stim_number', 'stim_interval', 'triad_inh_src']
+    columns += [name + '_pos' for name in INPUTS + ['triad_inh']]
+    columns += ['triad_inh_' + field for field in INPUT_PARAMS['netstim']]
+    columns += [name + '_' + field for name in INPUTS
+                for field in INPUT_PARAMS[input]]
+    return columns
+
+
+# fill in defaults and expand every per-triad parameter to a list of ntriads values
+def make_table(params, ntriads):
+    table = dict(DEFAULTS)
+    table.update(params)
+    table.setdefault('input', 'netstim')
+    columns = triad_columns(table['input'])
+    missing = [col for col in columns if col not in table]
+    if missing:
+        raise KeyError('missing triad parameters: {}'.format(', '.join(missing)))
+    for col in columns:
+        value = table[col]
+        if _is_scalar(value):
+            table[col] = [value] * ntriads
+        else:
+            value = list(value)
+            if len(value) not in (1, ntriads):
+                raise ValueError('parameter {!r} has {} values for {} triads'.format(
+                    col, len(value), ntriads))
+            table[col] = value * ntriads if len(value) == 1 else value
+    return table
+
+
+# copy of a table with some parameters replaced; a per-triad parameter
+# followed by a triad number (onset2, rc_exc_gmax3) only changes that triad
+def update_params(params, **values):
+    params = dict(params)
+    columns = triad_columns(params.get('input', 'netstim'))
+    ntriads = _count_triads(params)
+    for key, value in values.items():
+        match = re.fullmatch(r'(\w+?)(\d+)', key)
+        if key in columns or key in CIRCUIT_PARAMS or not match or match.group(1) not in columns:
+            params[key] = value
+            continue
+        name, k = match.group(1), int(match.group(2))
+        if not 1 <= k <= ntriads:
+            raise ValueError('{!r} refers to triad {} of {}'.format(key, k, ntriads))
+        column = params.get(name, DEFAULTS.get(name))
+        column = [column] * ntriads if _is_scalar(column) else list(column)
+        column[k - 1] = value
+        params[name] = column
+    return params
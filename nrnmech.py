@@ -0,0 +1,176 @@
+# =============================================================================
+# COMPILED MECHANISMS
+# -----------------------------------------------------------------------------
+# This file finds or builds the compiled library of the mechanisms/*.mod
+# files and loads it into NEURON, so the model runs from any directory
+# without calling nrnivmodl by hand. Builds are kept in a cache directory
+# under a hash of the .mod sources, the NEURON version and the platform, so
+# a library is compiled once and reused until one of those changes, e.g.
+#
+#     path = load()           # build if needed, then nrn_load_dll
+#     path = build()          # build if needed, without loading
+#
+# The cell modules call load() when they are imported. Nothing is loaded if
+# NEURON already loaded the mechanisms, e.g. from an x86_64/ directory in
+# the working directory: a leftover x86_64/ takes precedence over the cache.
+# load() then checks that library against mechanisms/*.mod, warns if it was
+# built from other sources and fails if it lacks mechanisms, so remove it
+# (or run nrnivmodl mechanisms again) after changing a .mod file. Point
+# TRIADIC_LGN_MECHANISMS at a shared directory so that fresh sweep nodes
+# reuse a library built elsewhere, and prebuild it once with
+#
+#     python nrnmech.py
+# =============================================================================
+
+import glob
+import hashlib
+import os
+import platform
+import re
+import shutil
+import subprocess
+import tempfile
+import warnings
+
+import neuron
+from neuron import h
+
+MECHANISMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mechanisms')
+BUILD_DIR = os.environ.get('TRIADIC_LGN_MECHANISMS', os.path.join(
+    os.path.expanduser('~'), '.cache', 'triadic-lgn', 'mechanisms'))
+
+# where nrnivmodl leaves the library, relative to the build directory
+LIBRARIES = ['*/libnrnmech.so', '*/.libs/libnrnmech.so', '*/libnrnmech.dylib',
+             'nrnmech.dll']
+
+_loaded = None # path of the library loaded by this process
+
+
+def _mod_files():
+    return sorted(glob.glob(os.path.join(MECHANISMS_DIR, '*.mod')))
+
+
+# hash of the .mod sources, NEURON version and platform a library is built for
+def build_hash():
+    digest = hashlib.sha256()
+    for part in (neuron.__version__, platform.system(), platform.machine()):
+        digest.update(part.encode() + b'\0')
+    for path in _mod_files():
+        digest.update(os.path.basename(path).encode() + b'\0')
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+# names of the mechanisms defined by the .mod files
+def mechanism_names():
+    names = []
+    for path in _mod_files():
+        with open(path) as f:
+            names += re.findall(r'^\s*(?:SUFFIX|POINT_PROCESS|ARTIFICIAL_CELL)\s+(\w+)',
+                                f.read(), re.MULTILINE)
+    return names
+
+
+# names of the mechanisms NEURON has loaded
+def _loaded_names():
+    names = set()
+    name = h.ref('')
+    for kind in (0, 1):
+        types = h.MechanismType(kind)
+        for i in range(int(types.count())):
+            types.select(i)
+            types.selected(name)
+            names.add(name[0])
+    return names
+
+
+def _library(directory):
+    for pattern in LIBRARIES:
+        found = glob.glob(os.path.join(directory, pattern))
+        if found:
+            return found[0]
+    return None
+
+
+# .mod files whose source is not in a library (nrnivmodl compiles the text
+# of each .mod file into it), e.g. one left in x86_64/ by an older build
+def stale_sources(library):
+    with open(library, 'rb') as f:
+        data = f.read()
+    stale = []
+    for path in _mod_files():
+        with open(path, 'rb') as f:
+            if f.read() not in data:
+                stale.append(os.path.basename(path))
+    return stale
+
+
+# path of the compiled library, built into the cache only if it is not there
+def build(force=False):
+    target = os.path.join(BUILD_DIR, build_hash())
+    library = _library(target)
+    if library is not None and not force:
+        return library
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    # build in a temporary directory and rename it into place, so that other
+    # processes never see half a build
+    tmp = tempfile.mkdtemp(dir=BUILD_DIR, prefix='build-')
+    try:
+        for path in _mod_files():
+            shutil.copy(path, tmp)
+        result = subprocess.run(['nrnivmodl', '.'], cwd=tmp, capture_output=True, text=True)
+        if result.returncode != 0 or _library(tmp) is None:
+            raise RuntimeError('nrnivmodl failed in {}:\n{}'.format(
+                tmp, (result.stdout + result.stderr)[-2000:]))
+        if force:
+            shutil.rmtree(target, ignore_errors=True)
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            pass # another process finished the same build first
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return _library(target)
+
+
+# load the compiled mechanisms into NEURON once per process; returns the path
+# of the library, or None if NEURON had already loaded them (see
+# _check_preloaded)
+def load():
+    global _loaded
+    if _loaded is not None:
+        return _loaded
+    names = set(mechanism_names())
+    loaded = names & _loaded_names()
+    if loaded:
+        _check_preloaded(names, loaded)
+        return None
+    library = build()
+    if not h.nrn_load_dll(library):
+        raise RuntimeError('could not load {}'.format(library))
+    _loaded = library
+    return library
+
+
+# check the mechanisms NEURON loaded before load(), normally from x86_64/ in
+# the working directory, against mechanisms/*.mod
+def _check_preloaded(names, loaded):
+    library = _library(os.getcwd())
+    where = library or 'a library outside the working directory'
+    if loaded != names:
+        raise RuntimeError('NEURON loaded mechanisms from {} without {}; remove it or run '
+                           'nrnivmodl mechanisms again'.format(
+                               where, ', '.join(sorted(names - loaded))))
+    if library is None:
+        warnings.warn('mechanisms were loaded from {}, which cannot be checked against '
+                      'mechanisms/*.mod'.format(where))
+        return
+    stale = stale_sources(library)
+    if stale:
+        warnings.warn('{} was not built from the current {}; remove it or run nrnivmodl '
+                      'mechanisms again'.format(library, ', '.join(stale)))
+
+
+if __name__ == '__main__':
+    print(build())
@@ -0,0 +1,222 @@
+# =============================================================================
+# POPULATIONS OF TRIAD CIRCUITS
+# -----------------------------------------------------------------------------
+# This file builds many independent circuits from 'network.py' on a square
+# grid and simulates them together. With nthread > 1 the circuits are dealt
+# round-robin to NEURON threads (the interneuron and relay cell of a circuit
+# always share a thread) and cache efficient memory layout is switched on,
+# e.g.
+#
+#     pop = Population(200, network.MODEL2)
+#     spikes = pop.run(tstop=100, nthread=8)   # one dict per circuit
+#     pop.set_params(dict(network.MODEL2, in_exc_weight=0.3))   # in place
+#
+# With distributed=True the population is split over MPI ranks: the cells
+# are dealt round-robin to ranks, so the interneuron and relay cell of a
+# circuit usually live on different ranks, and the axosomatic and triadic
+# connections between them are made through gids. Run it with e.g.
+#
+#     mpirun -n 4 python population.py --ncircuits 1000 --save spikes.json
+#     python population.py --ncircuits 1000 --compare spikes.json
+#
+# where the second, serial run checks that the spike times are the same.
+# -----------------------------------------------------------------------------
+# All mechanisms in mechanisms/ are declared THREADSAFE. NEURON threads need
+# every NetCon delay to be at least 2 dt, so for threaded runs the NetStims
+# of zero-delay RGC inputs start 2 dt earlier and their NetCons get 2 dt of
+# delay, which leaves the time the inputs arrive unchanged. The spike trains
+# of VecStim inputs (see 'stimuli.py') are moved 2 dt earlier in the same way.
+# =============================================================================
+
+import argparse
+import json
+import math
+
+import numpy as np
+from neuron import h
+from neuron.units import ms, mV, um
+
+import network
+import recording
+
+h.load_file('stdrun.hoc')
+
+
+class Population:
+
+    # constructor; for input 'vecstim' trains holds one spike train per triad
+    # of every circuit, circuit by circuit
+    def __init__(self, ncircuits, params, ntriads=None, spacing=100 * um,
+                 distributed=False, trains=None):
+        self._pc = h.ParallelContext()
+        self.distributed = distributed
+        if distributed:
+            self._pc.gid_clear()
+        pc = self._pc if distributed else None
+        side = int(math.ceil(math.sqrt(ncircuits)))
+        per = ntriads if ntriads is not None else network._count_triads(params)
+        if trains is not None and len(trains) != ncircuits * per:
+            raise ValueError('{} trains given for {} triads'.format(len(trains), ncircuits * per))
+        self.circuits = []
+        for i in range(ncircuits):
+            x, y = (i % side) * spacing, (i // side) * spacing
+            own = None if trains is None else trains[i * per:(i + 1) * per]
+            self.circuits.append(
+                network.TriadCircuit(params, ntriads, gid=i, x=x, y=y, pc=pc, trains=own))
+
+    def __repr__(self):
+        return 'Population({} circuits{})'.format(
+            len(self.circuits), ', distributed' if self.distributed else '')
+
+    def __len__(self):
+        return len(self.circuits)
+
+    # spike trains of the VecStim inputs, one per triad of every circuit
+    def set_trains(self, trains):
+        ntrains = sum(circuit.ntriads for circuit in self.circuits)
+        if len(trains) != ntrains:
+            raise ValueError('{} trains given for {} triads'.format(len(trains), ntrains))
+        first = 0
+        for circuit in self.circuits:
+            circuit.set_trains(trains[first:first + circuit.ntriads])
+            first += circuit.ntriads
+
+    # set the parameters of every circuit in place (see
+    # TriadCircuit.set_params), from one table or a list of one per circuit
+    def set_params(self, params):
+        tables = [params] * len(self.circuits) if isinstance(params, dict) else params
+        if len(tables) != len(self.circuits):
+            raise ValueError('{} tables given for {} circuits'.format(
+                len(tables), len(self.circuits)))
+        for circuit, table in zip(self.circuits, tables):
+            circuit.set_params(table)
+
+    # number of cells in the population (on all ranks)
+    def ncells(self):
+        return 2 * len(self.circuits)
+
+    # spread the circuits round-robin over nthread NEURON threads
+    def partition(self, nthread):
+        pc = self._pc
+        pc.nthread(nthread)
+        pc.partition() # drop any previous partitioning
+        if nthread == 1:
+            return
+        roots = [h.SectionList() for _ in range(nthread)]
+        for i, circuit in enumerate(self.circuits):
+            for cell in (circuit.interneuron, circuit.relaycell):
+                if cell is not None:
+                    roots[i % nthread].append(sec=cell.soma)
+        for i, sections in enumerate(roots):
+            pc.partition(i, sections)
+
+    # give every RGC input NetCon a delay of at least mindelay without
+    # changing when its events arrive; returns the shift of each NetStim
+    def _delay_inputs(self, mindelay):
+        shifts = []
+        for circuit in self.circuits:
+            for k, stim in enumerate(circuit.stims):
+                cons = [getattr(circuit, name + '_con')[k] for name in network.INPUTS]
+                cons = [con for con in cons if con is not None]
+                if not cons:
+                    continue
+                shift = max(0, mindelay - min(con.delay for con in cons))
+                if circuit.input == 'vecstim':
+                    train = circuit.train_vectors[k]
+                    first = train.min() if train.size() else float('inf')
+                else:
+                    train, first = None, stim.start
+                if shift > first:
+                    raise ValueError('{} starts too early to be run with threads'.format(circuit))
+                _shift_stim(stim, train, -shift)
+                for con in cons:
+                    con.delay += shift
+                shifts.append((stim, train, cons, shift))
+        return shifts
+
+    def _undelay_inputs(self, shifts):
+        for stim, train, cons, shift in shifts:
+            _shift_stim(stim, train, shift)
+            for con in cons:
+                con.delay -= shift
+
+    # simulate every circuit and return the spike times of each (on every rank);
+    # other recorders (e.g. an LFPRecorder of 'lfp.py') are flushed every chunk
+    def run(self, tstop=40 * ms, dt=0.025 * ms, v_init=-60 * mV, nthread=1, recorders=(),
+            chunk=10 * ms):
+        pc = self._pc if self.distributed else None
+        self.partition(nthread)
+        h.cvode.cache_efficient(nthread > 1)
+        shifts = self._delay_inputs(2 * dt) if nthread > 1 else []
+        spike_recorders = [recording.SpikeRecorder(circuit.spike_sources())
+                           for circuit in self.circuits]
+        if pc is not None:
+            # ranks exchange spikes at intervals of the shortest gid connection delay
+            pc.set_maxstep(10 * ms)
+        try:
+            # spikes alone need no flushing, so run in one chunk then
+            recording.run(spike_recorders + list(recorders), tstop, dt, v_init,
+                          chunk=chunk if recorders else tstop, pc=pc)
+        finally:
+            self._undelay_inputs(shifts)
+        spikes = [recorder.spikes() for recorder in spike_recorders]
+        if pc is None:
+            return spikes
+        # merge the spikes each rank recorded for its own cells
+        merged = [{} for _ in self.circuits]
+        for local in pc.py_allgather(spikes):
+            for circuit, part in zip(merged, local):
+                circuit.update(part)
+        return merged
+
+
+# move the spikes of a NetStim, or of the train a VecStim plays
+def _shift_stim(stim, train, shift):
+    if train is None:
+        stim.start += shift
+    else:
+        train.add(shift)
+
+
+# True if two runs gave the same spike times, to within tolerance
+def same_spikes(a, b, tolerance=1e-6):
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if sorted(x) != sorted(y):
+            return False
+        for label in x:
+            if len(x[label]) != len(y[label]) or \
+                    np.any(np.abs(np.asarray(x[label]) - np.asarray(y[label])) > tolerance):
+                return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='simulate a population of triad circuits')
+    parser.add_argument('--ncircuits', type=int, default=100)
+    parser.add_argument('--tstop', type=float, default=40)
+    parser.add_argument('--model', default='MODEL2', help='table from network.py')
+    parser.add_argument('--save', help='write spike times to this json file')
+    parser.add_argument('--compare', help='check spike times against this json file')
+    args = parser.parse_args()
+
+    h.nrnmpi_init()
+    pc = h.ParallelContext()
+    distributed = pc.nhost() > 1
+    pop = Population(args.ncircuits, getattr(network, args.model), distributed=distributed)
+    spikes = pop.run(args.tstop)
+    spikes = [{label: list(map(float, times)) for label, times in circuit.items()}
+              for circuit in spikes]
+    if pc.id() == 0:
+        nspikes = sum(len(times) for circuit in spikes for times in circuit.values())
+        print('{}: {} spikes on {} rank(s)'.format(pop, nspikes, int(pc.nhost())))
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(spikes, f)
+        if args.compare:
+            with open(args.compare) as f:
+                reference = json.load(f)
+            print('same spikes as {}: {}'.format(args.compare, same_spikes(spikes, reference)))
+    pc.barrier()
+    h.quit()
@@ -0,0 +1,260 @@
+# =============================================================================
+# PROFILING
+# -----------------------------------------------------------------------------
+# This file reports where the time of a run goes. Inside a Profile the model
+# code times its phases (building the cells of 'ballandsticks*.py', wiring
+# the synapses, finitialize, integration, flushing recorders), NEURON times
+# the compute of every mechanism (hh2, it2, ical, iahp, ican, iar, Cad, the
+# synapses, ...) and the events the NetCons of every circuit delivered in
+# the last run are counted by kind (RGC input, triadic and axosomatic
+# inhibition), e.g.
+#
+#     with Profile() as profile:
+#         circuit = network.TriadCircuit(network.MODEL2)
+#         circuit.run(tstop=1000)
+#     report = profile.report()   # json-friendly dict
+#
+# or from the command line, comparing with an earlier report:
+#
+#     python profiling.py --model MODEL2 --tstop 1000 --out before.json
+#     python profiling.py --model MODEL2 --tstop 1000 --compare before.json
+#
+# Outside a Profile the phase markers cost one function call each and no
+# events are counted.
+# -----------------------------------------------------------------------------
+# Mechanism times come from ParallelContext.mech_time and cover the current
+# and state updates of each mechanism; the rest of the integration time is
+# the matrix solve, event delivery and recording. Events are counted by an
+# EventCounter (mechanisms/eventcount.mod) on the source of every watched
+# NetCon, so counting adds NetCons: profile with events=False to start runs
+# from states of 'snapshot.py' saved without them.
+# =============================================================================
+
+import argparse
+import contextlib
+import json
+import time
+
+from neuron import h
+
+# phases in the order they happen in a run
+PHASES = ['construct', 'wiring', 'finitialize', 'integrate', 'record']
+
+_active = None # the Profile being recorded, if any
+
+
+# context timing a phase of the active Profile, or doing nothing
+def phase(name):
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.phase(name)
+
+
+# count the events delivered by NetCons of each kind, e.g.
+# {'rgc_input': [...], 'triad_inh': [...]}, if a Profile is active
+def watch(netcons):
+    if _active is not None and _active.count_events:
+        for kind, cons in netcons.items():
+            _active.watch(kind, cons)
+
+
+# make the event counters follow the delays of the NetCons they watch,
+# which may change between building and running (see 'population.py')
+def prepare():
+    if _active is not None:
+        for con, counter in _active._counters:
+            counter.delay = con.delay
+
+
+# names and internal types of every density mechanism and point process
+def mechanism_types():
+    types = {}
+    name = h.ref('')
+    for kind in (0, 1):
+        mechanisms = h.MechanismType(kind)
+        for i in range(int(mechanisms.count())):
+            mechanisms.select(i)
+            mechanisms.selected(name)
+            types[name[0]] = int(mechanisms.internal_type())
+    return types
+
+
+class Profile:
+
+    # constructor; events=False counts no events and adds no NetCons
+    def __init__(self, events=True):
+        self.count_events = events
+        self.phases = {}
+        self.calls = {}
+        self.mechanisms = {}
+        self.events = {}
+        self._counters = [] # (watched NetCon, counting NetCon)
+        self._kinds = []
+        self._cells = []
+        self._pc = h.ParallelContext()
+        self._start = None
+        self.wall = None
+        self.nsegments = None
+
+    def __repr__(self):
+        return 'Profile({} phases, {} watched NetCons)'.format(
+            len(self.phases), len(self._counters))
+
+    def __enter__(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError('another Profile is already active')
+        _active = self
+        self._pc.mech_time() # zero and switch on the mechanism timers
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        self.wall = time.perf_counter() - self._start
+        self.nsegments = sum(sec.nseg for sec in h.allsec())
+        self.mechanisms = {}
+        for name, type in mechanism_types().items():
+            seconds = self._pc.mech_time(type)
+            if seconds > 0:
+                self.mechanisms[name] = seconds
+        # keep the counts and drop the counters, which would slow later runs
+        self.events = self.event_counts()
+        self._counters, self._kinds, self._cells = [], [], []
+        _active = None
+        return False
+
+    # context adding the wall time spent inside it to a phase
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    # count the events the NetCons deliver, under the given kind
+    def watch(self, kind, netcons):
+        for con in netcons:
+            if con is None or con.syn() is None:
+                continue
+            counter = h.EventCounter()
+            if con.srcgid() >= 0 and con.pre() is None and con.preseg() is None:
+                # source on another rank
+                mirror = self._pc.gid_connect(con.srcgid(), counter)
+            elif con.pre() is not None:
+                mirror = h.NetCon(con.pre(), counter)
+            else:
+                seg = con.preseg()
+                mirror = h.NetCon(seg._ref_v, counter, sec=seg.sec)
+                mirror.threshold = con.threshold
+            mirror.delay = con.delay
+            self._counters.append((con, mirror))
+            self._kinds.append(kind)
+            self._cells.append(counter)
+
+    # events delivered in the last run, by kind of NetCon
+    def event_counts(self):
+        counts = {}
+        for kind, counter in zip(self._kinds, self._cells):
+            counts[kind] = counts.get(kind, 0) + int(counter.count)
+        return counts
+
+    # the profile as a dict of plain values, for json
+    def report(self):
+        phases = {name: {'s': self.phases[name], 'calls': self.calls[name]}
+                  for name in PHASES + sorted(set(self.phases) - set(PHASES))
+                  if name in self.phases}
+        mechanisms_s = sum(self.mechanisms.values())
+        return {'wall_s': self.wall, 'phases': phases,
+                'mechanisms': dict(sorted(self.mechanisms.items(), key=lambda item: -item[1])),
+                'mechanisms_s': mechanisms_s,
+                'integrate_other_s': self.phases.get('integrate', 0) - mechanisms_s,
+                'events': self.events,
+                'nsegments': self.nsegments,
+                'tstop': h.t}
+
+
+# flat {(section, name, field): value} of a report
+def _flatten(report):
+    rows = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            for name, entry in value.items():
+                if isinstance(entry, dict):
+                    for field, number in entry.items():
+                        rows[(key, name, field)] = number
+                else:
+                    rows[(key, name, '')] = entry
+        else:
+            rows[('', key, '')] = value
+    return rows
+
+
+# every value of two reports that differs by more than tolerance (a
+# fraction), as rows of section, name, before, after and ratio
+def compare(before, after, tolerance=0.1):
+    old, new = _flatten(before), _flatten(after)
+    rows = []
+    for key in list(old) + [key for key in new if key not in old]:
+        a, b = old.get(key), new.get(key)
+        if a == b:
+            continue
+        ratio = b / a if a and b is not None else None
+        if ratio is not None and abs(ratio - 1) <= tolerance:
+            continue
+        section, name, field = key
+        rows.append({'section': section, 'name': name + ('.' + field if field else ''),
+                     'before': a, 'after': b, 'ratio': ratio})
+    return rows
+
+
+def _print_report(report):
+    print('wall {:.4g} s, {} segments, t = {:g} ms'.format(
+        report['wall_s'], report['nsegments'], report['tstop']))
+    for name, entry in report['phases'].items():
+        print('  {:<22}{:>10.4g} s {:>8} calls'.format(name, entry['s'], entry['calls']))
+    for name, seconds in report['mechanisms'].items():
+        print('  {:<22}{:>10.4g} s'.format('mechanism ' + name, seconds))
+    print('  {:<22}{:>10.4g} s'.format('solve, events, other', report['integrate_other_s']))
+    for kind, count in report['events'].items():
+        print('  {:<22}{:>10} events'.format(kind, count))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='profile a run of triad circuits')
+    parser.add_argument('--model', default='MODEL2', help='table from network.py')
+    parser.add_argument('--ncircuits', type=int, default=1)
+    parser.add_argument('--tstop', type=float, default=40)
+    parser.add_argument('--method', default='fixed', help='fixed, cvode or lvardt')
+    parser.add_argument('--out', help='json file for the report')
+    parser.add_argument('--compare', help='json report of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='change reported when comparing (0.1 is 10%%)')
+    args = parser.parse_args()
+
+    import network
+    import population
+    # the model marks its phases in the imported module, not in __main__
+    import profiling
+
+    with profiling.Profile() as profile:
+        if args.ncircuits == 1:
+            circuit = network.TriadCircuit(getattr(network, args.model))
+            circuit.run(args.tstop, method=args.method)
+        else:
+            pop = population.Population(args.ncircuits, getattr(network, args.model))
+            pop.run(args.tstop)
+    report = profile.report()
+    profiling._print_report(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+        for row in profiling.compare(before, report, args.tolerance):
+            ratio = '' if row['ratio'] is None else ' ({:.2f}x)'.format(row['ratio'])
+            print('{} {}: {} -> {}{}'.format(row['section'], row['name'], row['before'],
+                                             row['after'], ratio))
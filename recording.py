@@ -0,0 +1,291 @@
+# =============================================================================
+# TRACE RECORDING
+# -----------------------------------------------------------------------------
+# This file records chosen variables (v, Cai, iCa, iother, ...) at chosen
+# segments and streams them to disk while the simulation runs. The run is
+# advanced in chunks; after each chunk the NEURON vectors are appended to a
+# .npy file (read back as a numpy memmap) or an HDF5 dataset (.h5) and
+# emptied, so memory use depends on the chunk length and not on tstop, e.g.
+#
+#     probes = select(circuit.interneuron.all, ['v', 'Cai'])
+#     probes += [(circuit.relaycell.soma, 0.5, 'iother')]
+#     recorder = TraceRecorder(probes, 'traces.npy')
+#     run([recorder], tstop=10000)
+#     traces = recorder.load()   # samples x probes, see recorder.labels
+#
+# Variables are NEURON range variables of the segment. Note that the
+# calcium ion of the mechanisms is called Ca, so its concentration and
+# current are Cai and iCa.
+# -----------------------------------------------------------------------------
+# When only spike times are needed, a SpikeRecorder attaches threshold
+# detecting NetCons to a few segments instead and keeps only event times,
+# so its output grows with the number of spikes rather than tstop/dt.
+# -----------------------------------------------------------------------------
+# Runs use fixed time steps of dt by default. With method='cvode' (one
+# variable time step for the whole model) or method='lvardt' (a variable
+# time step per cell) the step grows while the circuits are silent; traces
+# are then interpolated from the steps onto samples every dt. The absolute tolerance of each state is
+# atol times its scale in ATOLSCALE, or in the atolscale argument.
+# =============================================================================
+
+import json
+
+import numpy as np
+from neuron import h
+from neuron.units import ms, mV
+
+import profiling
+
+h.load_file('stdrun.hoc')
+
+METHODS = ('fixed', 'cvode', 'lvardt')
+
+# Cai is about 5e-5 mM, so scale its tolerance down to the 0.01 nM intended
+# in Cad.mod (the tolerance given there is not used for ion concentrations)
+ATOLSCALE = {'Cai': 1e-5}
+
+
+# choose the integration method (and tolerances) of the following runs
+def set_method(method='fixed', atol=1e-3, atolscale=None):
+    if method not in METHODS:
+        raise ValueError('method must be one of {}, not {!r}'.format(METHODS, method))
+    h.cvode.active(method != 'fixed')
+    h.cvode.use_local_dt(method == 'lvardt')
+    if method == 'fixed':
+        return
+    h.cvode.atol(atol)
+    scales = dict(ATOLSCALE)
+    scales.update(atolscale or {})
+    for name, scale in scales.items():
+        h.cvode.atolscale(name, scale)
+    # locate threshold crossings by interpolation so spike times stay precise
+    h.cvode.condition_order(2)
+
+
+# finitialize; with a state saved by 'snapshot.py' every cell then starts
+# from that state, while the events finitialize queued (input onsets) stay
+def initialize(v_init=-60 * mV, state=None):
+    with profiling.phase('finitialize'):
+        profiling.prepare()
+        h.finitialize(v_init)
+        if state is None:
+            return
+        state.restore(1)
+        h.t = 0
+        if h.cvode.active():
+            h.cvode.re_init()
+        else:
+            h.fcurrent()
+        h.frecord_init() # the first samples hold the restored state
+
+
+# advance the simulation to stop with the chosen integration method
+def advance(stop, pc=None):
+    with profiling.phase('integrate'):
+        if pc is not None:
+            pc.psolve(stop)
+        elif h.cvode.active():
+            h.cvode.solve(stop)
+        else:
+            h.continuerun(stop)
+
+
+# probes for the given variables at the given positions (default: every segment)
+def select(sections, variables=('v',), xs=None):
+    probes = []
+    for sec in sections:
+        positions = xs if xs is not None else [seg.x for seg in sec]
+        for x in positions:
+            for var in variables:
+                probes.append((sec, x, var))
+    return probes
+
+
+# advance the simulation to tstop in chunks, flushing every recorder after
+# each chunk; distributed models pass their ParallelContext to use psolve
+def run(recorders, tstop, dt=0.025 * ms, v_init=-60 * mV, chunk=10 * ms, pc=None,
+        method='fixed', atol=1e-3, atolscale=None, state=None):
+    set_method(method, atol, atolscale)
+    h.dt = dt
+    for recorder in recorders:
+        recorder.open(tstop, dt)
+    initialize(v_init, state)
+    while h.t < tstop - dt / 2:
+        advance(min(h.t + chunk, tstop), pc)
+        with profiling.phase('record'):
+            for recorder in recorders:
+                recorder.flush()
+    for recorder in recorders:
+        recorder.close()
+
+
+class TraceRecorder:
+
+    # constructor
+    def __init__(self, probes, path, every=1):
+        self.path = path
+        self.every = every  # keep one sample in every this many time steps
+        self.labels = []
+        self._refs = []
+        self._secs = []
+        for sec, x, var in probes:
+            try:
+                self._refs.append(getattr(sec(x), '_ref_' + var))
+            except (AttributeError, NameError):
+                raise ValueError('{}({}) has no variable {!r}'.format(sec.name(), x, var))
+            self._secs.append(sec)
+            self.labels.append('{}({:g}).{}'.format(sec.name(), x, var))
+        self._times = []
+        self._vectors = []
+        self._file = None
+        self._data = None
+
+    def __repr__(self):
+        return 'TraceRecorder({!r}, {} probes)'.format(self.path, len(self.labels))
+
+    # start recording and create the output for a run of tstop with time step dt,
+    # called before finitialize
+    def open(self, tstop, dt):
+        nsteps = int(round(tstop / dt)) + 1
+        nsamples = (nsteps + self.every - 1) // self.every
+        shape = (nsamples, len(self.labels))
+        self.dt = dt * self.every
+        self._nsamples = nsamples
+        self._step = 0   # time steps flushed so far
+        self._sample = 0 # samples written so far
+        if h.cvode.active():
+            # variable time steps: record at every step of the probe's cell
+            # (its own time with lvardt) and interpolate onto the sampling
+            # grid when flushing, sampling at fixed times would stop the
+            # integrator at each of them
+            self._times = [h.Vector().record(h._ref_t, sec=sec) for sec in self._secs]
+            self._vectors = [h.Vector().record(ref, sec=sec)
+                             for ref, sec in zip(self._refs, self._secs)]
+            self._last = None
+        else:
+            self._times = []
+            self._vectors = [h.Vector().record(ref) for ref in self._refs]
+        if self.path.endswith(('.h5', '.hdf5')):
+            import h5py # only needed for HDF5 output
+            self._file = h5py.File(self.path, 'w')
+            self._data = self._file.create_dataset(
+                'traces', shape, dtype='f8', chunks=(min(nsamples, 4096), len(self.labels)))
+            self._data.attrs['labels'] = self.labels
+            self._data.attrs['dt'] = self.dt
+        else:
+            # samples are appended to the file one chunk at a time
+            self._file = open(self.path, 'wb')
+            header = {'descr': '<f8', 'fortran_order': False, 'shape': shape}
+            np.lib.format.write_array_header_1_0(self._file, header)
+            with open(self.path + '.json', 'w') as f:
+                json.dump({'labels': self.labels, 'dt': self.dt}, f)
+
+    # copy what has been recorded since the last flush to disk and empty the vectors
+    def flush(self):
+        n = int(self._vectors[0].size()) if self._vectors else 0
+        if n == 0:
+            return
+        if self._times:
+            chunk = self._resample()
+        else:
+            # time steps of this chunk that fall on the sampling grid
+            first = (-self._step) % self.every
+            keep = slice(first, n, self.every)
+            # np.array copies through the buffer protocol; Vector.as_numpy views
+            # are not freed reliably and would make memory grow with tstop
+            chunk = np.column_stack([np.array(vec)[keep] for vec in self._vectors])
+        chunk = self._output(chunk)
+        if self._data is not None:
+            self._data[self._sample:self._sample + len(chunk)] = chunk
+        else:
+            self._file.write(chunk.astype('<f8').tobytes())
+        self._sample += len(chunk)
+        self._step += n
+        for vec in self._times + self._vectors:
+            vec.resize(0)
+
+    # what is written for a chunk of samples x probes, one column per label;
+    # subclasses may compute other columns from the probes
+    def _output(self, chunk):
+        return chunk
+
+    # samples on the grid up to the current time, interpolated from the
+    # variable steps recorded since the last flush
+    def _resample(self):
+        end = min(self._nsamples, int(h.t / self.dt + 1e-6) + 1)
+        grid = self.dt * np.arange(self._sample, end)
+        columns, last = [], []
+        for i, (times, vec, ref) in enumerate(zip(self._times, self._vectors, self._refs)):
+            # the steps of this chunk, the value at the current time and the
+            # last step of the previous chunk
+            t = np.append(np.array(times), h.t)
+            v = np.append(np.array(vec), ref[0])
+            if self._last is not None:
+                t = np.insert(t, 0, self._last[i][0])
+                v = np.insert(v, 0, self._last[i][1])
+            columns.append(np.interp(grid, t, v))
+            last.append((t[-1], v[-1]))
+        self._last = last
+        return np.column_stack(columns).reshape(len(grid), len(columns))
+
+    # stop recording and finish writing the output
+    def close(self):
+        for vec in self._times + self._vectors:
+            vec.play_remove()
+        self._times = []
+        self._vectors = []
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._data = None
+
+    # recorded traces, samples x probes (memory mapped for .npy output)
+    def load(self):
+        if self.path.endswith(('.h5', '.hdf5')):
+            import h5py
+            with h5py.File(self.path, 'r') as f:
+                return f['traces'][:]
+        return np.load(self.path, mmap_mode='r')
+
+
+class SpikeRecorder:
+
+    # constructor: sources maps a label to the (section, x) whose v is watched
+    def __init__(self, sources, threshold=0 * mV):
+        self.threshold = threshold
+        self._netcons = {}
+        self._times = {}
+        for label, (sec, x) in sources.items():
+            netcon = h.NetCon(sec(x)._ref_v, None, sec=sec)
+            netcon.threshold = threshold
+            self._times[label] = h.Vector()
+            netcon.record(self._times[label])
+            self._netcons[label] = netcon
+
+    def __repr__(self):
+        return 'SpikeRecorder({})'.format(', '.join(self._netcons))
+
+    # forget the spikes of a previous run
+    def open(self, tstop, dt):
+        for vec in self._times.values():
+            vec.resize(0)
+
+    # spike times are only kept in memory
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    # number of spikes recorded so far at every source
+    def mark(self):
+        return {label: int(vec.size()) for label, vec in self._times.items()}
+
+    # forget the spikes recorded since mark, to rerun from a checkpoint
+    def rewind(self, mark):
+        for label, vec in self._times.items():
+            vec.resize(mark[label])
+
+    # spike times of every source
+    def spikes(self):
+        return {label: np.array(vec) for label, vec in self._times.items()}
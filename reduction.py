@@ -0,0 +1,198 @@
+# =============================================================================
+# REDUCED INTERNEURON: FIT AND VALIDATION
+# -----------------------------------------------------------------------------
+# The ReducedInterneuron of 'ballandsticks2.py' keeps every section of the
+# full interneuron, so the triad inputs and outputs sit where they did, but
+# has 25 segments instead of 99 (with 3 dendrites). This file measures how
+# closely its inhibitory output follows the full model: the times of the
+# events it sends onto the relay cell, from axon_d(1) (axosomatic) and from
+# the distal tip of each dendrite (triadic). It also fits the settings of
+# the reduced cell to a set of circuits, e.g.
+#
+#     tables = [network.update_params(network.MODEL2, **point) for point in points]
+#     rows = compare(tables)          # one row per circuit
+#     print(summary(rows))            # spikes matched, timing errors, speedup
+#     settings, rows = fit(training_tables())
+#
+# Screen parameters with reduced=True in the table and confirm the hits
+# with the full interneuron. From the command line:
+#
+#     python reduction.py             # validate REDUCED on training and held out circuits
+#     python reduction.py --fit       # fit the settings again
+# -----------------------------------------------------------------------------
+# Coarse segments slow down spike propagation along the thin, leaky
+# neurites, so the fit scales their axial resistance and leak. It tries a
+# few nseg layouts and, for each, scales the settings in SCALES up and
+# down in turn (coordinate descent) while that lowers the score.
+# =============================================================================
+
+import argparse
+import math
+import time
+
+import numpy as np
+from neuron import h
+from neuron.units import ms, mV
+
+import ballandsticks2 as bs2
+import network
+import recording
+
+# settings of ReducedInterneuron scaled by the fit
+SCALES = ['dend_ra_scale', 'axon_ra_scale', 'g_pas_scale']
+
+# nseg of the soma, proximal and distal sections tried by the fit
+LAYOUTS = [(1, 1, 3), (1, 1, 5), (1, 3, 5)]
+
+# score of an output whose number of spikes differs from the full model
+MISMATCH_MS = 10 * ms
+
+
+# circuits the fit and the validation use by default: the three presets and
+# variations of their input strength and timing
+def training_tables():
+    m2, m3, m4 = network.MODEL2, network.MODEL3, network.MODEL4
+    return [m2, network.update_params(m2, in_exc_weight=0.3),
+            network.update_params(m2, triad_exc_weight=1),
+            network.update_params(m2, onset=[5 * ms, 8 * ms, 11 * ms]),
+            m3, network.update_params(m3, triad_exc_amp=2),
+            m4, network.update_params(m4, triad_exc_gmax=[2, 4, 6]),
+            network.update_params(m4, onset=[5 * ms, 7 * ms, 9 * ms])]
+
+
+# n circuits held out from the fit: the presets with the strength of every
+# RGC input scaled by 0.5 to 1.5 and the onsets of the triads moved by up
+# to 4 ms, drawn at random
+def random_tables(n=30, seed=0):
+    rng = np.random.default_rng(seed)
+    strengths = {'netstim': 'weight', 'iclamp': 'amp', 'alpha': 'gmax'}
+    tables = []
+    for i in range(n):
+        base = [network.MODEL2, network.MODEL3, network.MODEL4][i % 3]
+        table = network.make_table(base, network._count_triads(base))
+        for name in network.INPUTS:
+            column = name + '_' + strengths[table['input']]
+            table[column] = [value * rng.uniform(0.5, 1.5) for value in table[column]]
+        table['onset'] = [onset + rng.uniform(0, 4 * ms) for onset in table['onset']]
+        tables.append(table)
+    return tables
+
+
+# event times of the inhibitory outputs of a circuit and the run time
+def output_times(params, tstop=40 * ms, dt=0.025 * ms, v_init=-60 * mV):
+    circuit = network.TriadCircuit(params)
+    names = ['rc_inh'] + ['triad_inh{}'.format(k + 1) for k in range(circuit.ntriads)]
+    vectors = {name: h.Vector() for name in names}
+    for name, con in zip(names, [circuit.rc_inh_con] + circuit.triad_inh_con):
+        con.record(vectors[name])
+    recording.set_method('fixed')
+    h.dt = dt
+    start = time.perf_counter()
+    recording.initialize(v_init)
+    recording.advance(tstop)
+    seconds = time.perf_counter() - start
+    return {name: np.array(vec) for name, vec in vectors.items()}, seconds
+
+
+# how far the outputs of the reduced cell are from those of the full cell:
+# outputs with a different number of spikes, and the errors of the spike
+# times of the others (ms)
+def timing_error(full, reduced):
+    errors = []
+    mismatched = 0
+    for name, times in full.items():
+        if len(times) != len(reduced[name]):
+            mismatched += 1
+        else:
+            errors.append(np.abs(reduced[name] - times))
+    errors = np.concatenate([np.zeros(0)] + errors)
+    if not len(errors):
+        errors = np.zeros(1) # no spikes to compare counts as no error
+    return {'mismatched': mismatched, 'nspikes': sum(len(times) for times in full.values()),
+            'mean_error_ms': float(errors.mean()),
+            'rms_error_ms': float(np.sqrt(np.mean(errors ** 2))),
+            'max_error_ms': float(errors.max())}
+
+
+# run every table with the full and the reduced interneuron and return one
+# row per table; full holds outputs of the full model from an earlier call
+def compare(tables, reduced=True, tstop=40 * ms, dt=0.025 * ms, full=None):
+    if full is None:
+        full = [output_times(dict(params, reduced=None), tstop, dt) for params in tables]
+    rows = []
+    for params, (times, full_s) in zip(tables, full):
+        reduced_times, reduced_s = output_times(dict(params, reduced=reduced), tstop, dt)
+        row = timing_error(times, reduced_times)
+        row.update(full_s=full_s, reduced_s=reduced_s)
+        rows.append(row)
+    return rows
+
+
+# the rows of compare in a few numbers
+def summary(rows):
+    return {'ntables': len(rows),
+            'matched': sum(row['mismatched'] == 0 for row in rows) / len(rows),
+            'mismatched_outputs': sum(row['mismatched'] for row in rows),
+            'mean_error_ms': float(np.mean([row['mean_error_ms'] for row in rows])),
+            'rms_error_ms': float(np.sqrt(np.mean([row['rms_error_ms'] ** 2 for row in rows]))),
+            'max_error_ms': max(row['max_error_ms'] for row in rows),
+            'speedup': sum(row['full_s'] for row in rows) / sum(row['reduced_s'] for row in rows)}
+
+
+# lower is better: rms timing error plus MISMATCH_MS per mismatched output
+def score(rows):
+    return float(np.mean([row['rms_error_ms'] + MISMATCH_MS * row['mismatched']
+                          for row in rows]))
+
+
+# settings of the reduced interneuron that best follow the full model on
+# the tables, and the rows of compare for them; the cheapest layout wins
+# unless a larger one scores better by more than tolerance (ms)
+def fit(tables=None, layouts=LAYOUTS, start=None, factor=1.5, rounds=4, tolerance=0.1,
+        tstop=40 * ms, dt=0.025 * ms, verbose=False):
+    tables = training_tables() if tables is None else tables
+    full = [output_times(dict(params, reduced=None), tstop, dt) for params in tables]
+    best = None
+    for soma, proximal, distal in layouts:
+        settings = dict(bs2.REDUCED if start is None else start, soma_nseg=soma,
+                        proximal_nseg=proximal, distal_nseg=distal)
+        rows = compare(tables, settings, tstop, dt, full)
+        current = score(rows)
+        step = factor
+        for _ in range(rounds):
+            improved = False
+            for name in SCALES:
+                for change in (step, 1 / step):
+                    trial = dict(settings, **{name: settings[name] * change})
+                    trial_rows = compare(tables, trial, tstop, dt, full)
+                    if score(trial_rows) < current:
+                        settings, rows, current = trial, trial_rows, score(trial_rows)
+                        improved = True
+                        break
+            if not improved:
+                step = math.sqrt(step) # refine around the best settings so far
+        if verbose:
+            print('layout {}: score {:.4g} ms, {}'.format((soma, proximal, distal),
+                                                          current, summary(rows)))
+        if best is None or current < best[0] - tolerance:
+            best = (current, settings, rows)
+    return best[1], best[2]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='fit or validate the reduced interneuron')
+    parser.add_argument('--fit', action='store_true', help='fit the settings again')
+    parser.add_argument('--ntables', type=int, default=30, help='circuits to validate on')
+    parser.add_argument('--tstop', type=float, default=40)
+    args = parser.parse_args()
+
+    settings = bs2.REDUCED
+    if args.fit:
+        settings, rows = fit(tstop=args.tstop, verbose=True)
+        print('settings: {}'.format({name: round(value, 4) if isinstance(value, float)
+                                     else value for name, value in settings.items()}))
+    for name, tables in (('training', training_tables()),
+                         ('held out', random_tables(args.ntables))):
+        print('{} circuits'.format(name))
+        for key, value in summary(compare(tables, settings, tstop=args.tstop)).items():
+            print('{:>20}: {:.4g}'.format(key, value))
@@ -0,0 +1,173 @@
+# =============================================================================
+# RESTING STATE SNAPSHOTS
+# -----------------------------------------------------------------------------
+# After finitialize the calcium pools (Cad) and the slow iahp and iar
+# currents drift for about a second before the cells settle, and every run
+# would have to simulate that warm-up again. This file runs a circuit to
+# rest once, saves its state variables to disk and starts later runs from
+# that state, e.g.
+#
+#     states = StateCache(warmup=1000)
+#     traces = states.simulate(network.MODEL3, tstop=40)
+#     rows = sweep.run_sweep(points, states=states)
+#
+# The warm-up runs from t = -warmup to 0 with variable time steps, so the
+# inputs, which start at t >= 0, stay silent. The resting state depends on
+# the cells and on where the synapses sit, but not on the timing or strength
+# of the inputs, so the states are keyed by the parameters in REST_PARAMS
+# (with the sources and rate table settings) and one snapshot serves every
+# point of a sweep over onsets or weights.
+# -----------------------------------------------------------------------------
+# A RestState holds the state variables of the whole model, in the order of
+# the global variable step integrator (cvode.states), so the circuit must be
+# the only one built when its state is saved or restored. Unlike a SaveState
+# it holds no parameters, so synapse and input settings changed after the
+# warm-up are kept, and it is read from disk with numpy: reading SaveStates
+# into rebuilt circuits crashes NEURON after a few times.
+# =============================================================================
+
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+from neuron import h
+from neuron.units import ms, mV
+
+import cache
+import network
+import recording
+import tables
+
+STATE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'triadic-lgn', 'states')
+
+# table entries that change the structure or the resting state of a circuit
+REST_PARAMS = ['input', 'd_lambda', 'reduced', 'corrected_wiring', 'rc_exc_pos', 'in_exc_pos',
+               'triad_exc_pos', 'triad_inh_pos', 'rc_inh_pos']
+
+
+# run the model from t = -warmup to 0 with its inputs silent and return its
+# state at t = 0
+def warm_up(warmup=1000 * ms, v_init=-60 * mV, atol=1e-4):
+    recording.set_method('cvode', atol)
+    h.finitialize(v_init)
+    h.t = -warmup
+    h.cvode.re_init()
+    h.cvode.solve(0)
+    h.t = 0
+    values = h.Vector()
+    h.cvode.states(values)
+    return RestState(values.as_numpy())
+
+
+class RestState:
+
+    # constructor: the value of every state variable of the model
+    def __init__(self, values):
+        self.values = np.array(values, dtype=float)
+
+    def __repr__(self):
+        return 'RestState({} states)'.format(len(self.values))
+
+    # set every state variable of the model after finitialize, as
+    # SaveState.restore does for recording.initialize; the states are
+    # scattered by the global variable step integrator whatever the method;
+    # the flag SaveState.restore takes is ignored
+    def restore(self, *args):
+        active, local = h.cvode.active(), h.cvode.use_local_dt()
+        h.cvode.use_local_dt(0)
+        h.cvode.active(1)
+        h.cvode.re_init()
+        current = h.Vector()
+        h.cvode.states(current)
+        if current.size() != len(self.values):
+            raise ValueError('the model has {} states, not the {} of this state'.format(
+                int(current.size()), len(self.values)))
+        h.cvode.yscatter(h.Vector(self.values))
+        h.cvode.re_init() # currents and ion concentrations from the new states
+        h.cvode.active(active)
+        h.cvode.use_local_dt(local)
+
+
+class StateCache:
+
+    # constructor
+    def __init__(self, path=STATE_DIR, warmup=1000 * ms, v_init=-60 * mV, atol=1e-4):
+        self.path = path
+        self.warmup = warmup
+        self.v_init = v_init
+        self.atol = atol
+        os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return 'StateCache({!r}, warmup={})'.format(self.path, self.warmup)
+
+    # how the states are made, part of the key of runs started from them
+    def settings(self):
+        return {'warmup': self.warmup, 'v_init': self.v_init, 'atol': self.atol}
+
+    # key of the resting state of a circuit
+    def key(self, params, ntriads=None):
+        if ntriads is None:
+            ntriads = network._count_triads(params)
+        table = network.make_table(params, ntriads)
+        rest = {'params': {name: table[name] for name in REST_PARAMS}, 'ntriads': ntriads,
+                'settings': self.settings(), 'tables': tables.settings(),
+                'source': cache.source_hash()}
+        return hashlib.sha256(json.dumps(rest, sort_keys=True, default=float).encode()).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.npy')
+
+    # resting state of a circuit, from disk or by a warm-up run; the circuit
+    # kept by network.simulate(..., reuse=True) is dropped unless it is this one
+    def state(self, circuit):
+        if circuit is not network._reusable:
+            network.release()
+        sections = [sec for cell in (circuit.interneuron, circuit.relaycell) for sec in cell.all]
+        if len(sections) != sum(1 for _ in h.allsec()):
+            raise ValueError('a RestState holds the whole model, {} must be the only '
+                             'circuit built'.format(circuit))
+        key = self.key(circuit.params, circuit.ntriads)
+        state = self.get(key)
+        if state is None:
+            state = warm_up(self.warmup, self.v_init, self.atol)
+            self.put(key, state)
+        return state
+
+    # stored state, or None if it is not on disk
+    def get(self, key):
+        try:
+            return RestState(np.load(self._file(key)))
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+    # write a state to disk
+    def put(self, key, state):
+        # write to a temporary file first so other processes never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, state.values)
+        os.replace(tmp, self._file(key))
+
+    # build a circuit and simulate it from rest, see network.simulate; with
+    # reuse=True the circuit of network.reusable_circuit is set to the table
+    def simulate(self, params, tstop=40 * ms, dt=0.025 * ms, ntriads=None, output='traces',
+                 method='fixed', atol=1e-3, atolscale=None, reuse=False, trains=None):
+        if reuse:
+            circuit = network.reusable_circuit(params, ntriads, trains)
+        else:
+            network.release() # the new circuit must be the only one
+            circuit = network.TriadCircuit(params, ntriads=ntriads, trains=trains)
+        return circuit.run(tstop, dt, output=output, method=method, atol=atol,
+                           atolscale=atolscale, state=self.state(circuit))
+
+    # remove every state from the cache
+    def clear(self):
+        for path in glob.glob(os.path.join(self.path, '*.npy')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,95 @@
+# =============================================================================
+# RGC SPIKE TRAINS
+# -----------------------------------------------------------------------------
+# This file generates the spike trains of retinal inputs in bulk with numpy:
+# Poisson or gamma trains of any number of inputs are drawn as whole arrays,
+# and recorded trains are read from (time, input) pairs or from disk. A set
+# of trains is a list of arrays of increasing spike times (ms), one per
+# input. The circuits of 'network.py' play them through VecStim
+# (mechanisms/vecstim.mod) with input 'vecstim', one train per triad
+# driving its three RGC synapses, e.g.
+#
+#     trains = poisson(1000, rate=20, tstop=1000, seed=1)
+#     circuit = network.TriadCircuit(dict(network.MODEL2, input='vecstim'),
+#                                    ntriads=1000, trains=trains)
+#     circuit.set_trains(gamma(1000, rate=20, tstop=1000, order=3, seed=2))
+#
+# set_trains copies new trains into the Vectors the VecStims already play,
+# so no NEURON objects are made again between runs. A Population takes one
+# train per triad of every circuit, circuit by circuit, e.g.
+#
+#     pop = population.Population(100, params, trains=poisson(300, 20, 1000))
+#     save('trains.npz', trains)   # and trains = load('trains.npz')
+# =============================================================================
+
+import numpy as np
+from neuron.units import ms
+
+
+# random generator from a seed, or the generator itself
+def _rng(seed):
+    return seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+
+# split the concatenated spike times of the inputs into one array per input
+def _split(times, counts):
+    return np.split(times, np.cumsum(counts)[:-1])
+
+
+# n Poisson trains at rate (Hz) from start to tstop (ms)
+def poisson(n, rate, tstop, start=0 * ms, seed=None):
+    rng = _rng(seed)
+    counts = rng.poisson(rate * (tstop - start) / 1000, n)
+    times = rng.uniform(start, tstop, counts.sum())
+    owner = np.repeat(np.arange(n), counts)
+    return _split(times[np.lexsort((times, owner))], counts)
+
+
+# n gamma trains at rate (Hz) from start to tstop (ms), with interspike
+# intervals of the given order (1 is Poisson, higher is more regular); the
+# trains are stationary from start, the first spike falls a uniform fraction
+# into a length-biased interval
+def gamma(n, rate, tstop, order=2, start=0 * ms, seed=None):
+    rng = _rng(seed)
+    scale = 1000 / (rate * order)
+    expected = rate * (tstop - start) / 1000
+    width = int(expected + 6 * np.sqrt(expected) + 10)
+    first = rng.uniform(size=(n, 1)) * rng.gamma(order + 1, scale, (n, 1))
+    times = start + np.cumsum(np.hstack([first, rng.gamma(order, scale, (n, width - 1))]),
+                              axis=1)
+    # rarely a train needs more intervals than drawn
+    while len(times) and times[:, -1].min() < tstop:
+        more = np.cumsum(rng.gamma(order, scale, (n, width)), axis=1)
+        times = np.hstack([times, times[:, -1:] + more])
+    keep = times < tstop
+    return _split(times[keep], keep.sum(axis=1))
+
+
+# n regular trains of number spikes at interval from each onset (ms), as
+# the NetStims of 'model2.py'
+def regular(onsets, number=1, interval=0.5 * ms):
+    onsets = np.asarray(onsets, dtype=float)
+    return list(onsets[:, None] + interval * np.arange(number))
+
+
+# trains of n inputs from recorded spikes given as (time, input) pairs,
+# e.g. from a SpikeRecorder or a file of retinal recordings
+def from_events(times, inputs, n=None):
+    times = np.asarray(times, dtype=float)
+    inputs = np.asarray(inputs, dtype=int)
+    counts = np.bincount(inputs, minlength=n or 0)
+    if n is not None and len(counts) > n:
+        raise ValueError('spikes of input {} given for {} inputs'.format(inputs.max(), n))
+    return _split(times[np.lexsort((times, inputs))], counts)
+
+
+# write trains to an npz file as concatenated times and counts
+def save(path, trains):
+    counts = np.array([len(train) for train in trains], dtype=int)
+    times = np.concatenate(trains) if len(trains) else np.zeros(0)
+    np.savez(path, times=times, counts=counts)
+
+
+def load(path):
+    with np.load(path) as f:
+        return _split(f['times'], f['counts'])
@@ -0,0 +1,251 @@
+# =============================================================================
+# RESPONSE SURFACES
+# -----------------------------------------------------------------------------
+# The responses of a sweep (relay cell first spike time, peak voltage, ...)
+# change smoothly with onset offsets and synaptic weights, so between the
+# points of a finished sweep they can be interpolated instead of simulated.
+# A ResponseSurface fits a Gaussian process to the rows of run_sweep (or
+# run_branches) over the swept parameters and answers queries at new
+# points with an estimate and its error (one standard deviation), e.g.
+#
+#     grid = sweep.grid(rc_exc_weight=[0.5, 1, 2, 3, 4, 5], in_exc_weight=[0.1, 0.4, 0.8, 1.2])
+#     rows = sweep.run_sweep(grid, network.MODEL2, interpolate=True)
+#     surface = ResponseSurface(rows, ['rc_exc_weight', 'in_exc_weight'], base=network.MODEL2)
+#     estimates = surface.predict([{'rc_exc_weight': 2.4, 'in_exc_weight': 0.7}])
+#     rows = surface.query(points, tolerance={'rc_first_spike': 0.1})
+#
+# query simulates only the points whose error exceeds the tolerance, as
+# run_sweep would, and adds them to the surface so later queries near them
+# are answered from it. Each row says where it came from ('source' is
+# 'surface' or 'simulated'). Surfaces are saved as the rows they were fitted
+# to, e.g. surface.save('onsets.json') and load('onsets.json').
+# -----------------------------------------------------------------------------
+# Each parameter is scaled to [0, 1] over the fitted rows and each response
+# has its own Matern 5/2 kernel (rougher than a squared exponential one, so
+# that the error grows between the rows where the response bends sharply),
+# whose length scale per parameter and noise level are chosen from a small
+# grid to best predict the rows left out: for each swept value of each
+# parameter, the rows with that value are left out together and predicted
+# from the rest. The error of a prediction is scaled up by as much as the
+# errors of the worst of these exceed their standard deviations, since a
+# kernel fitted to a few rows is often too sure of itself and query skips
+# simulations on its word. Fit it to rows of sweeps with interpolate=True,
+# as query simulates them, whose spike times and peaks are interpolated
+# between samples (see 'analysis.py') rather than snapped to dt, so that
+# they are smooth in the parameters.
+# Responses that are nan where the relay cell does not spike (the first
+# spike time) are fitted where they are defined, together with the chance
+# that they are, and are nan at points where that chance is below one half;
+# points where it is between UNDECIDED and 1 - UNDECIDED count as uncertain.
+# Responses that jump rather than change smoothly (whether the onsets of
+# two triads coincide closely enough to fire the relay cell) are not
+# interpolated well: sweep those finely or simulate them.
+# =============================================================================
+
+import json
+
+import numpy as np
+from neuron.units import ms
+
+import network
+import sweep
+
+RESPONSES = ['rc_spikes', 'rc_first_spike', 'rc_peak_v']
+
+# length scales (in units of the parameter range) and noise levels tried
+LENGTH_SCALES = [0.1, 0.2, 0.35, 0.6, 1.0, 2.0]
+NOISES = [1e-6, 1e-3, 1e-2, 1e-1]
+
+# chance of a response being defined below which it is nan, and the margin
+# around one half within which that is left to simulation
+UNDECIDED = 0.25
+
+
+# Matern 5/2 kernel between the rows of a and b
+def _kernel(a, b, scales):
+    r = np.sqrt(5 * (((a[:, None, :] - b[None, :, :]) / scales) ** 2).sum(axis=-1))
+    return (1 + r + r ** 2 / 3) * np.exp(-r)
+
+
+class _Process:
+
+    # constructor: a Gaussian process through the values y at the points x
+    # (n x d, scaled to [0, 1]), with the length scales and noise that best
+    # predict the points left out by _held_out (the most likely ones when
+    # none are), and the calibration of its errors
+    def __init__(self, x, y):
+        self.x = x
+        self.mean = y.mean()
+        self.std = y.std() or 1.0
+        z = (y - self.mean) / self.std
+        self._held = self._held_out()
+        ndim = x.shape[1]
+        best = None
+        scales = np.full(ndim, LENGTH_SCALES[len(LENGTH_SCALES) // 2])
+        # one parameter at a time, twice over, then the noise
+        for _ in range(2):
+            for axis in range(ndim):
+                for scale in LENGTH_SCALES:
+                    trial = scales.copy()
+                    trial[axis] = scale
+                    for noise in NOISES:
+                        fit = self._fit(z, trial, noise)
+                        if fit is not None and (best is None or fit[0] > best[0]):
+                            best = fit
+                scales = best[1].copy()
+        (self.score, self.scales, self.noise, self._chol, self._alpha, self._scale2,
+         self.calibration) = best
+
+    # groups of points left out together: for each parameter with at least
+    # three values, the points with each value (a whole row of a grid, so
+    # that its neighbours along the other parameters cannot stand in for it,
+    # and single points when no two share a value)
+    def _held_out(self):
+        groups = {}
+        for column in self.x.T:
+            values, group = np.unique(column, return_inverse=True)
+            if len(values) >= 3:
+                for value in range(len(values)):
+                    out = np.flatnonzero(group == value)
+                    groups[tuple(out)] = out
+        return list(groups.values())
+
+    def _fit(self, z, scales, noise):
+        n = len(z)
+        k = _kernel(self.x, self.x, scales) + noise * np.eye(n)
+        try:
+            chol = np.linalg.cholesky(k)
+        except np.linalg.LinAlgError:
+            return None
+        alpha = np.linalg.solve(chol.T, np.linalg.solve(chol, z))
+        # signal variance at its most likely value for these scales
+        scale2 = max(z @ alpha / n, 1e-12)
+        if not self._held:
+            loglik = -0.5 * n * np.log(scale2) - np.log(np.diag(chol)).sum()
+            return loglik, scales, noise, chol, alpha, scale2, 1.0
+        # errors and variances of the predictions of each group left out
+        # from the rest; the calibration is the factor (at least 1) by which
+        # the errors of the worst group exceed their standard deviations, in
+        # root mean square, so that the errors err towards simulating
+        inverse = np.linalg.solve(chol.T, np.linalg.solve(chol, np.eye(n)))
+        score, worst = 0.0, 1.0
+        for out in self._held:
+            cov = np.linalg.inv(inverse[np.ix_(out, out)])
+            residual = cov @ alpha[out]
+            var = scale2 * np.diag(cov)
+            score -= 0.5 * (np.log(var) + residual ** 2 / var).sum()
+            worst = max(worst, float(np.sqrt(np.mean(residual ** 2 / var))))
+        return score, scales, noise, chol, alpha, scale2, worst
+
+    # mean and standard deviation at the points x, the latter scaled by the
+    # calibration
+    def predict(self, x):
+        ks = _kernel(x, self.x, self.scales)
+        mean = ks @ self._alpha
+        v = np.linalg.solve(self._chol, ks.T)
+        var = self._scale2 * np.maximum(1 + self.noise - (v ** 2).sum(axis=0), 0)
+        return self.mean + self.std * mean, self.calibration * self.std * np.sqrt(var)
+
+
+class ResponseSurface:
+
+    # constructor: fit the responses of the rows of a sweep over the named
+    # parameters; base, tstop, dt, cache and states are passed to run_sweep
+    # for the points query simulates
+    def __init__(self, rows, params, responses=None, base=network.MODEL3, tstop=40 * ms,
+                 dt=0.025 * ms, processes=1, cache=None, states=None):
+        self.params = list(params)
+        self.responses = [name for name in (responses or RESPONSES) if name in rows[0]]
+        self.base = base
+        self.tstop = tstop
+        self.dt = dt
+        self.processes = processes
+        self.cache = cache
+        self.states = states
+        self.rows = []
+        self.add(rows)
+
+    def __repr__(self):
+        return 'ResponseSurface({} over {}, {} rows)'.format(
+            ', '.join(self.responses), ', '.join(self.params), len(self.rows))
+
+    # add the rows of more runs and fit again
+    def add(self, rows):
+        for row in rows:
+            missing = [name for name in self.params + self.responses if name not in row]
+            if missing:
+                raise KeyError('row {} has no {}'.format(row, ', '.join(missing)))
+            self.rows.append({name: float(row[name]) for name in self.params + self.responses})
+        x = np.array([[row[name] for name in self.params] for row in self.rows])
+        self._low = x.min(axis=0)
+        self._range = np.where(x.max(axis=0) > self._low, x.max(axis=0) - self._low, 1)
+        x = self._scaled(x)
+        self._processes = {}
+        self._defined = {}
+        for name in self.responses:
+            y = np.array([row[name] for row in self.rows])
+            finite = np.isfinite(y)
+            self._processes[name] = _Process(x[finite], y[finite]) if finite.any() else None
+            if not finite.all():
+                self._defined[name] = _Process(x, finite.astype(float))
+
+    def _scaled(self, x):
+        return (np.asarray(x, dtype=float) - self._low) / self._range
+
+    # estimate and error of every response at the points, with a column
+    # '<response>_err' for each and 'uncertain' naming responses that are
+    # nan or not at a point it cannot tell
+    def predict(self, points):
+        x = self._scaled([[point[name] for name in self.params] for point in points])
+        rows = [dict(point, source='surface', uncertain=[]) for point in points]
+        for name in self.responses:
+            process = self._processes[name]
+            if process is None:
+                mean, err = np.full(len(x), np.nan), np.zeros(len(x))
+            else:
+                mean, err = process.predict(x)
+            if name in self._defined:
+                chance, _ = self._defined[name].predict(x)
+                mean = np.where(chance < 0.5, np.nan, mean)
+                err = np.where(chance < 0.5, 0.0, err)
+                for row, p in zip(rows, chance):
+                    if UNDECIDED < p < 1 - UNDECIDED:
+                        row['uncertain'].append(name)
+            for row, m, e in zip(rows, mean, err):
+                row[name] = float(m)
+                row[name + '_err'] = float(e)
+        return rows
+
+    # estimates at the points where every response with a tolerance has an
+    # error within it, and simulations (added to the surface) elsewhere
+    def query(self, points, tolerance):
+        rows = self.predict(points)
+        unknown = [name for name in tolerance if name not in self.responses]
+        if unknown:
+            raise KeyError('no response {}'.format(', '.join(unknown)))
+        redo = [i for i, row in enumerate(rows)
+                if any(name in row['uncertain'] or row[name + '_err'] > limit
+                       for name, limit in tolerance.items())]
+        if redo:
+            simulated = sweep.run_sweep([points[i] for i in redo], self.base, self.tstop,
+                                        self.dt, processes=self.processes, cache=self.cache,
+                                        states=self.states, interpolate=True)
+            for i, row in zip(redo, simulated):
+                rows[i] = dict(row, source='simulated', uncertain=[])
+                rows[i].update((name + '_err', 0.0) for name in self.responses)
+            self.add(simulated)
+        return rows
+
+    # the fitted parameters and rows, as json
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'params': self.params, 'responses': self.responses, 'rows': self.rows},
+                      f, indent=1)
+
+
+# a surface saved by ResponseSurface.save; keyword arguments are passed to
+# ResponseSurface (base, tstop, ... for simulating)
+def load(path, **kwargs):
+    with open(path) as f:
+        saved = json.load(f)
+    return ResponseSurface(saved['rows'], saved['params'], saved['responses'], **kwargs)
@@ -0,0 +1,102 @@
+# =============================================================================
+# PARAMETER SWEEPS
+# -----------------------------------------------------------------------------
+# This file runs the circuits of 'network.py' over a grid or list of
+# parameter points. Every point is simulated in a worker process of a
+# multiprocessing pool, so each worker has its own NEURON instance, and the
+# results are gathered in a single table with one row per point, e.g.
+#
+#     points = grid(onset2=[5, 6, 7, 8], onset3=[5, 6, 7, 8])
+#     rows = run_sweep(points, base=network.MODEL3)
+#     write_table(rows, 'onsets.csv')
+#
+# Parameter names are those of the tables in 'network.py', with a triad
+# number appended to change a single triad (onset2, rc_exc_gmax3). Passing a
+# ResultCache from 'cache.py' reuses runs simulated in earlier sweeps. With
+# output='spikes' only spike times are recorded, which is cheaper when the
+# voltage traces are not needed. Passing a StateCache from 'snapshot.py'
+# starts every point from the resting state instead of from finitialize.
+# Without a cache each process builds a circuit once and sets the
+# parameters of every later point in it (see TriadCircuit.set_params),
+# unless a point changes its structure or reuse=False. For input 'vecstim'
+# the trains given drive every point. The first spike time
+# and peak voltage are those of samples, or with interpolate=True those
+# interpolated between samples (see 'analysis.py').
+# =============================================================================
+
+import csv
+import itertools
+import multiprocessing
+
+import numpy as np
+from neuron.units import ms, mV
+
+import analysis
+import network
+
+
+# every combination of the given parameter values
+def grid(**axes):
+    names = list(axes)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(axes[name] for name in names))]
+
+
+# relay cell spike count, first spike time and peak voltage of one run (see
+# 'analysis.py' for many runs at once)
+def summarise(traces, threshold=0 * mV, interpolate=False):
+    measures = analysis.summarise(traces['t'], traces['v_rc'], threshold, interpolate)
+    return {'rc_spikes': int(measures['rc_spikes'][0]),
+            'rc_first_spike': float(measures['rc_first_spike'][0]),
+            'rc_peak_v': float(measures['rc_peak_v'][0])}
+
+
+# spike counts and first relay cell spike time of a spike output run
+def summarise_spikes(spikes):
+    rc = spikes['rc_soma']
+    return {'rc_spikes': len(rc),
+            'rc_first_spike': float(rc[0]) if len(rc) else np.nan,
+            'in_spikes': len(spikes['in_soma']),
+            'in_axon_spikes': len(spikes['in_axon_d'])}
+
+
+# simulate one sweep point, run in the worker processes
+def run_point(task):
+    base, point, tstop, dt, keep_traces, cache, output, states, reuse, interpolate, trains = task
+    params = network.update_params(base, **point)
+    if cache is not None:
+        traces = cache.simulate(params, tstop, dt, output=output, states=states, trains=trains)
+    elif states is not None:
+        traces = states.simulate(params, tstop, dt, output=output, reuse=reuse, trains=trains)
+    else:
+        traces = network.simulate(params, tstop, dt, output=output, reuse=reuse, trains=trains)
+    row = dict(point)
+    row.update(summarise(traces, interpolate=interpolate) if output == 'traces'
+               else summarise_spikes(traces))
+    if keep_traces:
+        row['traces'] = traces
+    return row
+
+
+# run every point of a sweep and return one row per point, in order
+def run_sweep(points, base=network.MODEL3, tstop=40 * ms, dt=0.025 * ms,
+              processes=None, keep_traces=False, chunksize=1, cache=None,
+              output='traces', states=None, reuse=True, interpolate=False, trains=None):
+    tasks = [(base, point, tstop, dt, keep_traces, cache, output, states, reuse, interpolate,
+              trains) for point in points]
+    if processes == 1:
+        rows = [run_point(task) for task in tasks]
+        network.release() # no circuit left behind in this process
+        return rows
+    # spawn rather than fork so that no NEURON state is shared with the parent
+    with multiprocessing.get_context('spawn').Pool(processes) as pool:
+        return list(pool.imap(run_point, tasks, chunksize))
+
+
+# write the scalar columns of a sweep to a csv file
+def write_table(rows, path):
+    names = [name for name in rows[0] if name != 'traces']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, names, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,86 @@
+# =============================================================================
+# RATE TABLES
+# -----------------------------------------------------------------------------
+# The voltage dependent rates of the hh2, it2, ical, cat1h and iar channels
+# (mechanisms/*.mod) are looked up in tables of TABLE_SIZE points from vmin
+# to vmax instead of being computed from exponentials at every segment and
+# time step. This file switches the tables on or off and sets their range,
+# which also sets their resolution, and compares runs with and without
+# them, e.g.
+#
+#     use_tables()                            # tables from -100 to 100 mV
+#     use_tables(True, vmin=-90, vmax=60)     # finer tables, narrower range
+#     use_tables(False)                       # exact rates again
+#     errors = validate(network.MODEL2, tstop=1000)
+#
+# The mechanisms load with exact rates (usetable_* = 0), so runs match the
+# published model until tables are switched on. Below vmin and above vmax
+# the rates at vmin and vmax are used.
+# =============================================================================
+
+import time
+
+import numpy as np
+from neuron import h
+from neuron.units import ms, mV
+
+import network
+
+MECHANISMS = ['hh2', 'it2', 'ical', 'cat1h', 'iar']
+TABLE_SIZE = 400 # intervals per table, set by WITH in the .mod files
+
+
+# use rate tables (or exact rates) from vmin to vmax in every mechanism
+def use_tables(enabled=True, vmin=-100 * mV, vmax=100 * mV):
+    if vmax <= vmin:
+        raise ValueError('vmax must be above vmin, not {} <= {}'.format(vmax, vmin))
+    for name in MECHANISMS:
+        setattr(h, 'usetable_' + name, int(enabled))
+        setattr(h, 'vmin_' + name, vmin)
+        setattr(h, 'vmax_' + name, vmax)
+
+
+# current table settings of every mechanism: (enabled, vmin, vmax)
+def settings():
+    return {name: (bool(getattr(h, 'usetable_' + name)),
+                   getattr(h, 'vmin_' + name), getattr(h, 'vmax_' + name))
+            for name in MECHANISMS}
+
+
+def _restore(saved):
+    for name, (enabled, vmin, vmax) in saved.items():
+        setattr(h, 'usetable_' + name, int(enabled))
+        setattr(h, 'vmin_' + name, vmin)
+        setattr(h, 'vmax_' + name, vmax)
+
+
+# spike times from threshold crossings of a trace
+def _spike_times(t, v, threshold=0 * mV):
+    crossings = np.flatnonzero((v[:-1] < threshold) & (v[1:] >= threshold)) + 1
+    return t[crossings]
+
+
+# error of a run with rate tables against the same run with exact rates
+def validate(params, tstop=1000 * ms, dt=0.025 * ms, vmin=-100 * mV, vmax=100 * mV,
+             method='fixed'):
+    saved = settings()
+    runs = {}
+    try:
+        for enabled in (False, True):
+            use_tables(enabled, vmin, vmax)
+            start = time.perf_counter()
+            runs[enabled] = network.simulate(params, tstop, dt, method=method)
+            runs[enabled]['run_s'] = time.perf_counter() - start
+    finally:
+        _restore(saved)
+    exact, tabled = runs[False], runs[True]
+    errors = {'resolution': (vmax - vmin) / TABLE_SIZE,
+              'exact_s': exact['run_s'], 'table_s': tabled['run_s'],
+              'speedup': exact['run_s'] / tabled['run_s']}
+    for name in ('v_rc', 'v_in', 'v_axon'):
+        errors[name + '_max_err'] = float(np.abs(tabled[name] - exact[name]).max())
+        a = _spike_times(exact['t'], exact[name])
+        b = _spike_times(tabled['t'], tabled[name])
+        errors[name + '_spike_err'] = (float(np.abs(a - b).max(initial=0))
+                                       if len(a) == len(b) else np.inf)
+    return errors